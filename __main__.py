@@ -2,24 +2,64 @@ import typer
 from portfolio.Parser import PortfolioParser
 from portfolio.Plotter import console_plot
 from portfolio.Portfolio import Portfolio
-from portfolio.Database import DB
+from portfolio.Database import get_db, DB
 import pandas as pd
 import json
+from typing import Optional
 
 from downloader.__main__ import updater
+from downloader.scheduler import Scheduler
 
 app = typer.Typer(add_completion=True)
-db = DB()
+db = get_db()
 
 
 @app.command()
-def db_update(ticker=None):
+def db_update(ticker=None, concurrency: int = 4, rate: Optional[float] = None, batch_size: int = 20,
+              resume: bool = False):
     """
     Update all tickers in the DB for all tickers. Alternatively can also update only the passed tickers.
     Args:
         ticker: (list) Valid Nasdaq tickers.
+        concurrency: Number of batches of tickers updated in parallel.
+        rate: Maximum number of calls per second made to Yahoo Finance.
+        batch_size: Maximum number of tickers downloaded from Yahoo Finance at once.
+        resume: Continue the last update cycle where it stopped, if it was interrupted.
     """
-    updater(ticker)
+    updater(ticker, concurrency=concurrency, rate=rate, batch_size=batch_size, resume=resume)
+
+
+@app.command()
+def db_schedule(delay: int = 30, concurrency: int = 4, rate: Optional[float] = None, batch_size: int = 20,
+                catch_up: bool = True):
+    """
+    Keep the DB up to date: the tickers of each exchange (NYSE, XETRA, Frankfurt) are updated shortly after its
+    sessions close, non-trading days are skipped. Runs until interrupted.
+    Args:
+        delay: Minutes between the close of a session and the update.
+        concurrency: Number of batches of tickers updated in parallel.
+        rate: Maximum number of calls per second made to Yahoo Finance.
+        batch_size: Maximum number of tickers downloaded from Yahoo Finance at once.
+        catch_up: Update the tickers that missed sessions at start.
+    """
+    scheduler = Scheduler(lambda tickers: updater(tickers, concurrency=concurrency, rate=rate, batch_size=batch_size),
+                          delay=delay * 60)
+    scheduler.run(catch_up=catch_up)
+
+
+@app.command()
+def db_migrate(layout: str = 'yearly', index_name: str = 'time-series'):
+    """
+    Copy all tickers of the DB to another storage layout (daily, yearly or monthly documents per ticker). Set
+    BENCHMARK_DB_LAYOUT to the new layout afterwards to read from it.
+    Args:
+        layout: Target storage layout.
+        index_name: Index to migrate.
+    """
+    if not isinstance(db, DB):
+        print(f"Storage layouts only apply to the ES backend, the {type(db).__name__} backend has nothing to migrate.")
+        raise typer.Exit(code=1)
+    print(f"Migrated {db.migrate(index_name, layout)} tickers to the {layout} layout.")
 
 
 @app.command()
@@ -1,9 +1,10 @@
-from typing import AnyStr, Union
+from typing import AnyStr, Union, Optional
+from collections import defaultdict
 import pandas as pd
-import time
-from downloader import utils
-from portfolio.Database import DB
-import datetime
+from downloader import utils, pipeline
+from downloader.manifest import Manifest
+from downloader.trading_calendar import CALENDARS, calendar_of, session_time
+from portfolio.Database import get_db
 
 pd.set_option('display.max_columns', None)
 pd.set_option('display.max_rows', 500)
@@ -13,21 +14,36 @@ pd.set_option('display.width', 1000)
 logger = utils.get_logger("downloader")
 
 
-def updater(tickers: Union[AnyStr, None] = None) -> None:
+def updater(tickers: Union[AnyStr, None] = None, concurrency: int = 4, rate: Optional[float] = None,
+            batch_size: int = 20, resume: bool = False) -> None:
     """
     Saves historical values fetched from Yahoo Finance (YF) to local Elasticsearch cluster.
     Multiple runs updates the missing time points in the ES.
+    Tickers missing the same days are downloaded together in batches, by a pool of workers whose calls to YF are
+    throttled by a shared rate limiter. Downloads, normalization and writes to the DB run as concurrent stages of a
+    pipeline, see downloader.pipeline.
+    The status of each ticker of a whole update cycle is recorded in a manifest (see downloader.manifest.Manifest),
+    which allows resuming an interrupted cycle. Failed tickers are retried in later cycles after a backoff.
     Args:
         tickers (str): If present (Example: 'FB') then fetches data for that specific ticker. Otherwise starts a
         whole update cycle, running across all tickers returned by `utils.get_all_tickers()`.
+        concurrency: Number of batches downloaded in parallel.
+        rate: Maximum number of calls per second made to YF, defaults to BENCHMARK_YF_RATE (see utils.yf_limiter).
+        batch_size: Maximum number of tickers downloaded at once.
+        resume: Continue the last cycle if it was interrupted, its tickers that are done are skipped.
     """
-    db = DB()
+    # the calls of this run are throttled at RATE, without changing the limiter shared by the process.
+    limiter = utils.RateLimiter(rate, burst=utils.yf_limiter.burst) if rate is not None else None
+    db = get_db()
 
     # create indices if they are not already created
     for ind in ['time-series']:
         db.setup_es_index(ind)
 
-    if tickers is None:  # fetch a list of tickers if not given
+    manifest = Manifest() if tickers is None else None  # only whole update cycles are recorded.
+    if manifest is not None and resume and manifest.unfinished:
+        tickers = pd.Series(manifest.cycle, name='Symbol')
+    elif tickers is None:  # fetch a list of tickers if not given
         logger.info("Fetching tickers from internet.")
         tickers = utils.get_all_tickers()
         if tickers is None:
@@ -36,35 +52,37 @@ def updater(tickers: Union[AnyStr, None] = None) -> None:
     else:
         tickers = pd.Series(tickers, name='Symbol')  # put it to the same format returned by utils.get_all_tickers().
 
-    for ticker in tickers:
+    tickers = tickers.tolist() if manifest is None else manifest.start(tickers.tolist(), resume)
+    # last stored date of all tickers, with one request instead of reading their histories.
+    last_dates = db.last_dates(ind, tickers=tickers)
+    # tickers are considered current when their last date falls on the last session of their exchange, with a tolerance
+    # of half a day around UTC midnight for the dates stored in the time zone of the exchange. Nothing is downloaded
+    # on weekends and holidays for the tickers updated after the previous session.
+    current_from = {name: session_time(calendar.last_session()) - 12 * 60 * 60 for name, calendar in CALENDARS.items()}
+    todo = [ticker for ticker in tickers
+            if last_dates.get(ticker) is None or last_dates[ticker] < current_from[calendar_of(ticker).name]]
+    for ticker in set(tickers) - set(todo) if manifest is not None else []:
+        manifest.record(ticker, 0)
+    logger.info(f"Skipping {len(tickers) - len(todo)} of {len(tickers)} tickers that are up to date.")
 
-        logger.info(f"==================Working on ticker {ticker}==================")
-        # get ticker from ES.
-        df_db = db.read(ticker, output_format='series')
-        # find the latest available date and use its following day as the start argument for the YF call.
-        start = datetime.datetime.strptime('1900-01-01', '%Y-%m-%d')
-        if not df_db.empty:
-            start_minus_one = df_db.index.max()
-            logger.info(f"Received a DF of size {df_db.shape[0]} from the DB.")
-            logger.info(f"Last found date in the DB is {datetime.datetime.fromtimestamp(start_minus_one)}.")
-            start = start_minus_one + 24 * 60 * 60
-            start = datetime.datetime.fromtimestamp(start)
-            logger.info(f"The first missing date is {start}.")
-        # get a standardized DF from yf
-        df = utils.yf_call(ticker, start)
+    # group the tickers by their last stored date, so that each batch is downloaded from the same start.
+    groups = defaultdict(list)
+    for ticker in todo:
+        groups[last_dates.get(ticker)].append(ticker)
+    batches = [(group[i:i + batch_size], last_date)
+               for last_date, group in groups.items() for i in range(0, len(group), batch_size)]
+    logger.info(f"Downloading {len(todo)} tickers in {len(batches)} batches.")
 
-        if not df.empty:
-            logger.info(f"Got a DF of size {df.shape[0]}, the first date is {df.index.min()} and the last one is"
-                        f" {df.index.max()}")
-            if db.write(ind, df):
-                logger.info(f'Success... Wrote {df.shape[0]} new rows for {ticker}.')
-                logger.info(f"Will wait a bit before the next call")
-                time.sleep(5)
-            else:
-                logger.warning(f'Something went wrong while writing {ticker} to db...')
-                # Sleep a bit so that Yahoo doesn't black list us
-        else:
-            logger.warning(f'Returned/Filtered df for {ticker} is empty.')
+    progress = utils.Progress(len(todo))
+    if manifest is None:
+        pipeline.run(db, ind, batches, progress, fetchers=concurrency, limiter=limiter)
+    else:
+        try:
+            pipeline.run(db, ind, batches, progress, fetchers=concurrency, on_done=manifest.record, limiter=limiter)
+        finally:  # keep the outcome of the processed tickers when interrupted.
+            manifest.save(force=True)
+        manifest.finish()
+    progress.report(force=True)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,129 @@
+"""Persistent manifest of db-update cycles, to resume interrupted cycles and to back off from failing tickers."""
+from typing import AnyStr, List, Optional, Dict
+from time import time
+import datetime
+import threading
+import json
+import os
+from downloader import utils
+
+logger = utils.get_logger(__name__)
+
+PENDING, DONE, FAILED = 'pending', 'done', 'failed'
+
+
+class Manifest:
+    """
+    Status of each ticker in the current update cycle, stored as a JSON file:
+
+        {"started_at": ..., "finished_at": ..., "cycle": ["AAPL", ...],
+         "tickers": {"AAPL": {"status": "done", "attempts": 0, "last_attempt": ..., "next_attempt": ..., "rows": 1,
+                              "error": null}}}
+
+    A ticker is pending until it is written to the DB (done) or fails (failed). Failed tickers are retried in later
+    cycles after an exponential backoff, which is reset once they succeed. The file is saved at most every
+    SAVE_INTERVAL seconds while the cycle is running, and when it ends.
+    """
+
+    def __init__(self, path: Optional[AnyStr] = None, backoff: float = 15 * 60, max_backoff: float = 24 * 60 * 60,
+                 save_interval: float = 5.):
+        """
+        Args:
+            path: JSON file of the manifest, defaults to the BENCHMARK_MANIFEST_PATH environment variable or
+            ~/.benchmark/db-update.json.
+            backoff: Seconds before a ticker that failed once is retried, doubled after each failure.
+            max_backoff: Upper bound of the backoff.
+            save_interval: Minimum number of seconds between two saves.
+        """
+        path = os.environ.get('BENCHMARK_MANIFEST_PATH', '~/.benchmark/db-update.json') if path is None else path
+        self.path = os.path.expanduser(path)
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.save_interval = save_interval
+        self.saved_at = 0.
+        self.data = {'started_at': None, 'finished_at': None, 'cycle': list(), 'tickers': dict()}
+        self._lock = threading.Lock()
+        if os.path.exists(self.path):
+            try:
+                with open(self.path) as f:
+                    self.data = json.load(f)
+            except (OSError, ValueError) as err:
+                logger.error(f"Cannot load the manifest {self.path}, starting a new one: {err}")
+
+    @property
+    def tickers(self) -> Dict[AnyStr, Dict]:
+        return self.data['tickers']
+
+    @property
+    def cycle(self) -> List[AnyStr]:
+        """Tickers of the current, or last, cycle."""
+        return self.data['cycle']
+
+    @property
+    def unfinished(self) -> bool:
+        """True when the last cycle was interrupted."""
+        return self.data['started_at'] is not None and self.data['finished_at'] is None
+
+    def start(self, tickers: List[AnyStr], resume: bool = False) -> List[AnyStr]:
+        """
+        Starts a cycle over TICKERS, or resumes the unfinished one when RESUME.
+        Returns:
+            Tickers to update: those not done yet in a resumed cycle, and in both cases without the failed ones whose
+            backoff is not over.
+        """
+        now = time()
+        with self._lock:
+            if resume and self.unfinished:
+                started_at = datetime.datetime.fromtimestamp(self.data['started_at'])
+                logger.info(f"Resuming the cycle started at {started_at}.")
+            else:
+                if resume:
+                    logger.info("There is no unfinished cycle to resume, starting a new one.")
+                self.data['started_at'] = now
+                self.data['cycle'] = list(tickers)
+                for entry in self.tickers.values():
+                    entry['status'] = FAILED if entry['status'] == FAILED else PENDING
+            self.data['finished_at'] = None
+            todo = list()
+            for ticker in tickers:
+                entry = self.tickers.setdefault(ticker, {'status': PENDING, 'attempts': 0, 'last_attempt': None,
+                                                         'next_attempt': None, 'rows': None, 'error': None})
+                if entry['status'] == DONE:
+                    continue
+                if entry['status'] == FAILED and entry['next_attempt'] > now:
+                    continue
+                todo.append(ticker)
+        logger.info(f"{len(tickers) - len(todo)} of {len(tickers)} tickers are done or backing off.")
+        self.save(force=True)
+        return todo
+
+    def record(self, ticker: AnyStr, rows: Optional[int] = None, error: Optional[AnyStr] = None):
+        """Records the outcome of TICKER, failed when ERROR is given."""
+        now = time()
+        with self._lock:
+            entry = self.tickers[ticker]
+            entry['last_attempt'] = now
+            if error is None:
+                entry.update(status=DONE, attempts=0, next_attempt=None, rows=rows, error=None)
+            else:
+                attempts = entry['attempts'] + 1
+                delay = min(self.max_backoff, self.backoff * 2 ** (attempts - 1))
+                entry.update(status=FAILED, attempts=attempts, next_attempt=now + delay, rows=None, error=error)
+        self.save()
+
+    def finish(self):
+        with self._lock:
+            self.data['finished_at'] = time()
+        self.save(force=True)
+
+    def save(self, force: bool = False):
+        """Writes the manifest atomically, so that it is never left half written."""
+        with self._lock:
+            if not force and time() - self.saved_at < self.save_interval:
+                return
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path + '.tmp', 'w') as f:
+                json.dump(self.data, f)
+            os.replace(self.path + '.tmp', self.path)
+            self.saved_at = time()
@@ -0,0 +1,184 @@
+"""Staged update pipeline: YF downloads, normalization and bulk writes to the DB overlap."""
+from typing import AnyStr, List, Tuple, Optional, Callable, Iterable, Iterator, Any, Dict
+from queue import Queue, Empty
+from threading import Thread
+from functools import partial
+import datetime
+import pandas as pd
+from downloader import utils
+
+logger = utils.get_logger(__name__)
+
+# marks the end of the items of a queue.
+DONE = object()
+
+
+def start_stage(name: AnyStr, fun: Callable[[Any], Iterator], inbox: Queue, outbox: Queue,
+                workers: int) -> List[Thread]:
+    """
+    Starts WORKERS threads putting the items yielded by FUN for each item of INBOX to OUTBOX. The stage stops at DONE,
+    which is passed to OUTBOX once all workers are done. Bounded queues block the workers of the previous stage when
+    this stage falls behind. FUN is expected to handle its errors, the items it fails on are lost.
+    """
+    def work():
+        while True:
+            item = inbox.get()
+            if item is DONE:
+                inbox.put(DONE)  # so that the other workers of the stage stop as well.
+                return
+            try:
+                for out in fun(item):
+                    outbox.put(out)
+            except Exception as err:  # the worker must survive, otherwise the pipeline would stall.
+                logger.error(f"Stage {name} failed on {item}: {err}")
+
+    threads = [Thread(target=work, name=f"{name}-{i}", daemon=True) for i in range(workers)]
+    for thread in threads:
+        thread.start()
+
+    def close():
+        for thread in threads:
+            thread.join()
+        outbox.put(DONE)
+    Thread(target=close, name=f"{name}-close", daemon=True).start()
+    return threads
+
+
+class EmptyDownload(Exception):
+    """YF returned no data for any ticker of a batch, see download."""
+
+    def __init__(self, data: Dict[AnyStr, pd.DataFrame]):
+        super().__init__('YF returned no data')
+        self.data = data
+
+
+def download(tickers: List[AnyStr], start: datetime.datetime,
+             limiter: Optional[utils.RateLimiter] = None) -> Dict[AnyStr, pd.DataFrame]:
+    """
+    utils.yf_download, raising EmptyDownload when none of TICKERS has data. yfinance logs its errors and returns empty
+    frames instead of raising, so that a failed call is retried like the others.
+    """
+    data = utils.yf_download(tickers, start, limiter)
+    if all([df.empty for df in data.values()]):
+        raise EmptyDownload(data)
+    return data
+
+
+def fetch(batch: Tuple[List[AnyStr], Optional[int]], limiter: Optional[utils.RateLimiter] = None) -> Iterator[Tuple]:
+    """
+    Downloads a batch of tickers sharing the same last stored date, throttled by LIMITER (see utils.yf_download).
+    Yields (ticker, raw data, start, error) for each ticker, the raw data is None and the error is given when the
+    download failed after all retries. A batch still empty after all retries has no new data.
+    """
+    tickers, last_date = batch
+    # YF data is indexed on naive dates, the days after the latest available date are kept.
+    start = datetime.datetime.strptime('1900-01-01', '%Y-%m-%d')
+    if last_date is not None:
+        start = datetime.datetime.utcfromtimestamp(last_date)
+    error = None
+    try:
+        data = utils.retry(download, tickers, start, limiter)
+    except EmptyDownload as err:
+        data = err.data
+    except Exception as err:
+        logger.error(f"YF call for {tickers} failed: {err}")
+        data, error = dict(), f"YF call failed: {err}"
+    for ticker in tickers:
+        yield ticker, data.get(ticker), start, error
+
+
+def normalize(item: Tuple[AnyStr, Optional[pd.DataFrame], datetime.datetime]) -> Iterator[Tuple]:
+    """Converts the raw data of a ticker to a standard DF with Close, ticker columns indexed on date, see fetch."""
+    ticker, df, start, error = item
+    try:
+        yield ticker, None if df is None else utils.standardize(df, ticker, start), error
+    except (KeyError, ValueError, TypeError) as err:
+        logger.error(f"Unexpected YF data for {ticker}: {err}")
+        yield ticker, None, f"Unexpected YF data: {err}"
+
+
+def index(db, index_name: AnyStr, inbox: Queue, progress: utils.Progress, bulk_rows: int, flush_interval: float,
+          on_done: Optional[Callable[[AnyStr, Optional[int], Optional[AnyStr]], None]] = None):
+    """
+    Bulk indexer: coalesces the DFs of many tickers and writes them to the DB once they hold BULK_ROWS rows, or when
+    no DF arrived for FLUSH_INTERVAL seconds. The outcome of each ticker is counted in PROGRESS and passed to ON_DONE,
+    errors of ON_DONE are logged.
+    """
+    pending = list()  # (ticker, df)
+
+    def done(ticker: AnyStr, rows: Optional[int], error: Optional[AnyStr] = None):
+        try:
+            progress.update(rows or 0, failed=error is not None)
+            if on_done is not None:
+                on_done(ticker, rows, error)
+        except Exception as err:  # the indexer must drain its inbox, otherwise the pipeline would stall.
+            logger.error(f"Reporting the outcome of {ticker} failed: {err}")
+
+    def flush():
+        frames = [df for _, df in pending if not df.empty]
+        try:
+            ok = db.write(index_name, pd.concat(frames)) if frames else True
+        except Exception as err:
+            logger.error(f"Bulk write failed: {err}")
+            ok = False
+        if not ok:
+            logger.warning(f"Something went wrong while writing {[t for t, df in pending if not df.empty]} to db...")
+        for ticker, df in pending:
+            done(ticker, df.shape[0], None if ok or df.empty else "Writing to the DB failed.")
+        pending.clear()
+
+    while True:
+        try:
+            item = inbox.get(timeout=flush_interval)
+        except Empty:
+            if pending:
+                flush()
+            continue
+        if item is DONE:
+            break
+        ticker, df, error = item
+        if df is None:
+            done(ticker, None, error or "No data.")
+            continue
+        if df.empty:
+            logger.warning(f'Returned/Filtered df for {ticker} is empty.')
+        pending.append((ticker, df))
+        if sum([df.shape[0] for _, df in pending]) >= bulk_rows:
+            flush()
+    if pending:
+        flush()
+
+
+def run(db, index_name: AnyStr, batches: Iterable[Tuple[List[AnyStr], Optional[int]]], progress: utils.Progress,
+        fetchers: int = 4, normalizers: int = 2, bulk_rows: int = 5000, flush_interval: float = 5.,
+        queue_size: int = 8, on_done: Optional[Callable[[AnyStr, Optional[int], Optional[AnyStr]], None]] = None,
+        limiter: Optional[utils.RateLimiter] = None):
+    """
+    Updates the DB with the tickers of BATCHES, a batch being a list of tickers and their last stored date. Fetch
+    workers download the batches, normalizers convert the data of each ticker to standard DFs, and a bulk indexer
+    writes them to the DB. Stages are connected by queues of at most QUEUE_SIZE items, so that the memory use does not
+    depend on the number of tickers.
+    Args:
+        db: DB instance.
+        index_name: Index to update.
+        batches: (tickers, last stored date) of each batch.
+        progress: Progress of the cycle, updated by the indexer.
+        fetchers: Number of download workers.
+        normalizers: Number of normalization workers.
+        bulk_rows: Number of rows per write.
+        flush_interval: Seconds after which the coalesced rows are written, however many they are.
+        queue_size: Maximum number of items waiting between two stages.
+        on_done: Called with (ticker, written rows, error) once a ticker is written or failed, the error is None
+        on success.
+        limiter: Rate limiter of the YF calls of this run, utils.yf_limiter by default.
+    """
+    q_batches, q_raw, q_frames = Queue(queue_size), Queue(queue_size), Queue(queue_size)
+    start_stage('fetch', partial(fetch, limiter=limiter), q_batches, q_raw, fetchers)
+    start_stage('normalize', normalize, q_raw, q_frames, normalizers)
+    indexer = Thread(target=index, args=(db, index_name, q_frames, progress, bulk_rows, flush_interval, on_done),
+                     name='index', daemon=True)
+    indexer.start()
+    for batch in batches:
+        q_batches.put(batch)  # blocks when the fetch workers are busy.
+    q_batches.put(DONE)
+    indexer.join()
@@ -0,0 +1,106 @@
+"""Long-running update mode: the tickers of each exchange are refreshed shortly after its sessions close."""
+from typing import AnyStr, Callable, Dict, List, Optional, Tuple
+from collections import defaultdict
+from threading import Event
+from time import time
+import datetime
+from downloader import utils
+from downloader.trading_calendar import CALENDARS, TradingCalendar, calendar_of
+from portfolio.Database import get_db
+
+logger = utils.get_logger(__name__)
+
+
+class Scheduler:
+    """
+    Runs an update of the tickers of an exchange DELAY seconds after each of its sessions closes, nothing is run on
+    weekends and holidays. The tickers are those listed by `utils.get_all_tickers()` and the ones already stored in the
+    DB, grouped by exchange with `trading_calendar.calendar_of`.
+    """
+
+    def __init__(self, update: Optional[Callable[[List[AnyStr]], None]] = None, delay: float = 30 * 60,
+                 calendars: Optional[Dict[AnyStr, TradingCalendar]] = None, index_name: AnyStr = 'time-series'):
+        """
+        Args:
+            update: Updates a list of tickers, defaults to downloader.__main__.updater.
+            delay: Seconds between the close of a session and the update, the time YF takes to publish the prices.
+            calendars: Calendars of the exchanges to update, defaults to all of trading_calendar.CALENDARS.
+            index_name: Index whose tickers are updated.
+        """
+        if update is None:
+            from downloader.__main__ import updater
+            update = updater
+        self.update = update
+        self.delay = delay
+        self.calendars = CALENDARS if calendars is None else calendars
+        self.index_name = index_name
+        self.last_updated = dict()  # exchange name: last session it was updated for.
+        self.stopped = Event()
+
+    def tickers(self) -> Dict[AnyStr, List[AnyStr]]:
+        """Tickers to update grouped by the name of their exchange."""
+        tickers = set(get_db().list_tickers(self.index_name))
+        listed = utils.get_all_tickers()
+        if listed is None:
+            logger.warning("Cannot fetch the list of tickers, only the tickers of the DB are updated.")
+        else:
+            tickers.update(listed.tolist())
+        groups = defaultdict(list)
+        for ticker in sorted(tickers):
+            groups[calendar_of(ticker).name].append(ticker)
+        return groups
+
+    def next_run(self, now: Optional[float] = None) -> Tuple[float, List[AnyStr]]:
+        """Time of the next update and the names of the exchanges it covers."""
+        now = time() if now is None else now
+        times = {name: calendar.next_refresh(now, self.delay) for name, calendar in self.calendars.items()}
+        at = min(times.values())
+        return at, [name for name, t in times.items() if t == at]
+
+    def sessions(self, now: Optional[float] = None) -> Dict[AnyStr, datetime.date]:
+        """Latest session of each exchange whose update is due at NOW, see TradingCalendar.last_session."""
+        return {name: calendar.last_session(now, self.delay) for name, calendar in self.calendars.items()}
+
+    def due(self, now: Optional[float] = None) -> List[AnyStr]:
+        """Names of the exchanges with a session that closed since their last update, or never updated."""
+        return [name for name, session in self.sessions(now).items()
+                if name not in self.last_updated or self.last_updated[name] < session]
+
+    def run_once(self, exchanges: List[AnyStr], now: Optional[float] = None):
+        """
+        Updates the tickers of EXCHANGES for their latest session at NOW, which is recorded in last_updated. An update
+        that fails is logged and retried at the next session.
+        """
+        sessions = self.sessions(now)
+        tickers = self.tickers()
+        for name in exchanges:
+            self.last_updated[name] = sessions[name]
+            if not tickers.get(name):
+                continue
+            logger.info(f"Updating {len(tickers[name])} tickers of {name} for the session of {sessions[name]}.")
+            try:
+                self.update(tickers[name])
+            except Exception as err:
+                logger.error(f"Update of {name} failed: {err}")
+
+    def run(self, catch_up: bool = True):
+        """
+        Runs the updates until stop() is called. Each iteration updates the exchanges with a session that closed since
+        their last update, also the ones that fell due while the previous updates were running. With CATCH_UP, the
+        tickers that missed sessions are updated at start, otherwise only the sessions closing from now on.
+        """
+        if not catch_up:
+            self.last_updated.update(self.sessions())
+        while not self.stopped.is_set():
+            exchanges = self.due()
+            if exchanges:
+                self.run_once(exchanges)
+                continue
+            at, exchanges = self.next_run()
+            logger.info(f"Next update of {exchanges} at {datetime.datetime.fromtimestamp(at)}.")
+            # woken up at least hourly, so that the clock is checked again after a suspend.
+            while not self.stopped.is_set() and time() < at:
+                self.stopped.wait(min(at - time(), 60 * 60))
+
+    def stop(self):
+        self.stopped.set()
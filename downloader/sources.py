@@ -0,0 +1,194 @@
+"""Market data sources: Yahoo Finance, and a record/replay of its responses to run the downloader offline."""
+from typing import AnyStr, Dict, List, Optional
+from functools import lru_cache
+from abc import ABC, abstractmethod
+import threading
+import datetime
+import random
+import time
+import os
+import pandas as pd
+import yfinance as yf
+from portfolio.utils import get_logger
+
+logger = get_logger(__name__)
+
+
+class MarketDataSource(ABC):
+    """
+    Interface of the sources of raw market data. Prices are returned the way YF does: DFs with Open, High, Low, Close,
+    Volume columns indexed on naive dates, empty when the source has no data.
+    """
+
+    @abstractmethod
+    def history(self, ticker: AnyStr, start: datetime.datetime) -> pd.DataFrame:
+        """Daily prices of TICKER from START on."""
+
+    def download(self, tickers: List[AnyStr], start: datetime.datetime) -> Dict[AnyStr, pd.DataFrame]:
+        """Daily prices of many TICKERS from START on, at once."""
+        return {ticker: self.history(ticker, start) for ticker in tickers}
+
+    @abstractmethod
+    def listed_tickers(self) -> pd.DataFrame:
+        """Listed tickers, a DF with a Symbol column."""
+
+
+class YahooSource(MarketDataSource):
+    """Prices from Yahoo Finance, and the tickers listed in the Nasdaq exchange from their public ftp server."""
+
+    def history(self, ticker: AnyStr, start: datetime.datetime) -> pd.DataFrame:
+        return yf.Ticker(ticker).history(start=start.strftime('%Y-%m-%d'), interval='1d')
+
+    def download(self, tickers: List[AnyStr], start: datetime.datetime) -> Dict[AnyStr, pd.DataFrame]:
+        """Uses yfinance's multi-ticker download."""
+        data = yf.download(tickers, start=start.strftime('%Y-%m-%d'), interval='1d', group_by='ticker',
+                           progress=False, show_errors=False)
+        out = dict()
+        for ticker in tickers:
+            if len(tickers) == 1:  # columns are not grouped by ticker for a single ticker.
+                df = data
+            elif ticker in data.columns.get_level_values(0):
+                df = data[ticker]
+            else:  # yfinance upper cases the symbols.
+                df = data[ticker.upper()]
+            out[ticker] = df.dropna(how='all')
+        return out
+
+    def listed_tickers(self) -> pd.DataFrame:
+        # an alternative ticker list, maybe be merge this with the one above.
+        # url = 'ftp://ftp.nasdaqtrader.com/SymbolDirectory/otherlisted.txt'
+        url = 'ftp://ftp.nasdaqtrader.com/SymbolDirectory/nasdaqlisted.txt'
+        return pd.read_csv(url, sep='|', skipfooter=1)
+
+
+class RecordingSource(MarketDataSource):
+    """
+    Records the responses of another source to PATH while passing them through, one CSV file of prices per ticker and
+    tickers.csv for the listed tickers. Prices of successive calls are merged, so that a recorded db-update can be
+    replayed from any start.
+    """
+
+    def __init__(self, source: MarketDataSource, path: AnyStr):
+        self.source = source
+        self.path = os.path.expanduser(path)
+        os.makedirs(self.path, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def history(self, ticker: AnyStr, start: datetime.datetime) -> pd.DataFrame:
+        df = self.source.history(ticker, start)
+        self.record(ticker, df)
+        return df
+
+    def download(self, tickers: List[AnyStr], start: datetime.datetime) -> Dict[AnyStr, pd.DataFrame]:
+        data = self.source.download(tickers, start)
+        for ticker, df in data.items():
+            self.record(ticker, df)
+        return data
+
+    def listed_tickers(self) -> pd.DataFrame:
+        df = self.source.listed_tickers()
+        df.to_csv(os.path.join(self.path, 'tickers.csv'), index=False)
+        return df
+
+    def record(self, ticker: AnyStr, df: pd.DataFrame):
+        if df.empty:
+            return
+        with self._lock:
+            recorded = read_prices(self.path, ticker)
+            if recorded is not None:
+                df = pd.concat([recorded, df])
+                df = df.loc[~df.index.duplicated(keep='last')].sort_index()
+            df.to_csv(prices_file(self.path, ticker))
+
+
+class ReplaySource(MarketDataSource):
+    """
+    Serves the responses recorded by RecordingSource, without network access. Each call can be slowed down by a
+    synthetic latency and fail at random, to benchmark the downloader and the DB in realistic conditions.
+    """
+
+    def __init__(self, path: AnyStr, latency: float = 0., jitter: float = 0., error_rate: float = 0.,
+                 seed: Optional[int] = None):
+        """
+        Args:
+            path: Directory of the recording.
+            latency: Seconds each call takes.
+            jitter: Upper bound of a uniformly distributed delay added to the latency.
+            error_rate: Probability that a call of history or download raises a ConnectionError.
+            seed: Seed of the random latencies and errors, for reproducible runs.
+        """
+        self.path = os.path.expanduser(path)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def call(self, what: AnyStr):
+        """Simulates the latency of a call and the injected errors."""
+        with self._lock:  # random.Random is not thread-safe.
+            delay = self.latency + self.random.uniform(0, self.jitter)
+            failed = self.random.random() < self.error_rate
+        if delay > 0:
+            time.sleep(delay)
+        if failed:
+            raise ConnectionError(f"Injected error for {what}.")
+
+    def history(self, ticker: AnyStr, start: datetime.datetime) -> pd.DataFrame:
+        self.call(ticker)
+        return self.replay(ticker, start)
+
+    def download(self, tickers: List[AnyStr], start: datetime.datetime) -> Dict[AnyStr, pd.DataFrame]:
+        self.call(tickers)
+        return {ticker: self.replay(ticker, start) for ticker in tickers}
+
+    def replay(self, ticker: AnyStr, start: datetime.datetime) -> pd.DataFrame:
+        df = read_prices(self.path, ticker)
+        if df is None:  # like YF for unknown tickers.
+            return pd.DataFrame(columns=['Open', 'High', 'Low', 'Close', 'Volume'],
+                                index=pd.DatetimeIndex([], name='Date'))
+        return df.loc[df.index >= pd.Timestamp(start.date())]
+
+    def listed_tickers(self) -> pd.DataFrame:
+        file = os.path.join(self.path, 'tickers.csv')
+        return pd.read_csv(file) if os.path.exists(file) else pd.DataFrame(columns=['Symbol'])
+
+
+def prices_file(path: AnyStr, ticker: AnyStr) -> AnyStr:
+    return os.path.join(path, ticker.replace('/', '_') + '.csv')
+
+
+def read_prices(path: AnyStr, ticker: AnyStr) -> Optional[pd.DataFrame]:
+    """Recorded prices of TICKER, None when it was not recorded."""
+    file = prices_file(path, ticker)
+    if not os.path.exists(file):
+        return None
+    df = pd.read_csv(file, index_col=0, parse_dates=True)
+    df.index = df.index.astype('datetime64[ns]')  # dates are converted to epoch ns, see utils.standardize.
+    return df
+
+
+@lru_cache(maxsize=None)
+def get_source(kind: Optional[AnyStr] = None) -> MarketDataSource:
+    """
+    Returns the market data source shared by all modules of the process.
+
+    Args:
+        kind: yahoo, record (Yahoo Finance recorded to disk) or replay (of a recording), defaults to the
+        BENCHMARK_MARKET_DATA environment variable or yahoo. The recording is stored in BENCHMARK_MARKET_DATA_DIR
+        (~/.benchmark/market-data by default), the replay is configured with BENCHMARK_REPLAY_LATENCY,
+        BENCHMARK_REPLAY_JITTER (seconds), BENCHMARK_REPLAY_ERROR_RATE and BENCHMARK_REPLAY_SEED.
+    """
+    kind = os.environ.get('BENCHMARK_MARKET_DATA', 'yahoo') if kind is None else kind
+    path = os.environ.get('BENCHMARK_MARKET_DATA_DIR', '~/.benchmark/market-data')
+    if kind == 'yahoo':
+        return YahooSource()
+    if kind == 'record':
+        return RecordingSource(YahooSource(), path)
+    if kind == 'replay':
+        seed = os.environ.get('BENCHMARK_REPLAY_SEED')
+        return ReplaySource(path, latency=float(os.environ.get('BENCHMARK_REPLAY_LATENCY', 0)),
+                            jitter=float(os.environ.get('BENCHMARK_REPLAY_JITTER', 0)),
+                            error_rate=float(os.environ.get('BENCHMARK_REPLAY_ERROR_RATE', 0)),
+                            seed=None if seed is None else int(seed))
+    raise ValueError(f"Unknown market data source {kind}, must be yahoo, record or replay.")
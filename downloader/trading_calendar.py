@@ -0,0 +1,141 @@
+"""Trading calendars of the exchanges, computed from holiday rules so that they work offline."""
+from typing import AnyStr, Callable, Optional, Set, Tuple
+from functools import lru_cache
+from time import time
+import datetime
+import pandas as pd
+
+DAY = datetime.timedelta(days=1)
+
+# exceptional closures of the NYSE that no rule predicts.
+NYSE_CLOSURES = {datetime.date(2001, 9, 11), datetime.date(2001, 9, 12), datetime.date(2001, 9, 13),
+                 datetime.date(2001, 9, 14), datetime.date(2004, 6, 11), datetime.date(2007, 1, 2),
+                 datetime.date(2012, 10, 29), datetime.date(2012, 10, 30), datetime.date(2018, 12, 5),
+                 datetime.date(2025, 1, 9)}
+
+
+def easter(year: int) -> datetime.date:
+    """Easter Sunday of YEAR in the Gregorian calendar (anonymous Gregorian algorithm)."""
+    a, b, c = year % 19, year // 100, year % 100
+    d, e = divmod(b, 4)
+    g = (8 * b + 13) // 25
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l_ = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 19 * l_) // 433
+    month, day = divmod(h + l_ - 7 * m + 90, 25)
+    return datetime.date(year, month, (h + l_ - 7 * m + 33 * month + 19) % 32)
+
+
+def nth_weekday(year: int, month: int, weekday: int, n: int) -> datetime.date:
+    """N-th WEEKDAY (0 is Monday) of MONTH, the last one when N is -1."""
+    if n > 0:
+        day = datetime.date(year, month, 1)
+        return day + ((weekday - day.weekday()) % 7 + 7 * (n - 1)) * DAY
+    day = datetime.date(year + month // 12, month % 12 + 1, 1) - DAY
+    return day - ((day.weekday() - weekday) % 7) * DAY
+
+
+def observed(day: datetime.date) -> datetime.date:
+    """US rule for holidays falling on a weekend: observed on the Friday before or the Monday after."""
+    return day - DAY if day.weekday() == 5 else day + DAY if day.weekday() == 6 else day
+
+
+def nyse_holidays(year: int) -> Set[datetime.date]:
+    """Full-day holidays of the NYSE (also followed by the Nasdaq)."""
+    days = {nth_weekday(year, 2, 0, 3),  # Washington's Birthday
+            easter(year) - 2 * DAY,  # Good Friday
+            nth_weekday(year, 5, 0, -1),  # Memorial Day
+            observed(datetime.date(year, 7, 4)),
+            nth_weekday(year, 9, 0, 1),  # Labor Day
+            nth_weekday(year, 11, 3, 4),  # Thanksgiving
+            observed(datetime.date(year, 12, 25))}
+    # New Year's Day is not observed on the Friday before when it falls on a Saturday.
+    if datetime.date(year, 1, 1).weekday() != 5:
+        days.add(observed(datetime.date(year, 1, 1)))
+    if year >= 1998:
+        days.add(nth_weekday(year, 1, 0, 3))  # Martin Luther King Jr. Day
+    if year >= 2022:
+        days.add(observed(datetime.date(year, 6, 19)))  # Juneteenth
+    return days | {day for day in NYSE_CLOSURES if day.year == year}
+
+
+def xetra_holidays(year: int) -> Set[datetime.date]:
+    """Full-day holidays of the Frankfurt Stock Exchange, for XETRA and floor trading."""
+    return {datetime.date(year, 1, 1), easter(year) - 2 * DAY, easter(year) + DAY, datetime.date(year, 5, 1),
+            datetime.date(year, 12, 24), datetime.date(year, 12, 25), datetime.date(year, 12, 26),
+            datetime.date(year, 12, 31)}
+
+
+class TradingCalendar:
+    """
+    Sessions of an exchange: the weekdays that are not holidays. Daily prices of a session are expected once it
+    closes, at CLOSE in the time zone of the exchange. Times are epoch seconds, as in the DB.
+    """
+
+    def __init__(self, name: AnyStr, tz: AnyStr, close: datetime.time, holidays: Callable[[int], Set[datetime.date]],
+                 suffixes: Tuple[AnyStr, ...] = ()):
+        """
+        Args:
+            name: Name of the exchange.
+            tz: Time zone of the exchange.
+            close: Local closing time of the sessions.
+            holidays: Returns the holidays of a given year.
+            suffixes: Suffixes of the YF symbols listed on the exchange (e.g. '.F').
+        """
+        self.name = name
+        self.tz = tz
+        self.close = close
+        self.holidays = lru_cache(maxsize=None)(holidays)
+        self.suffixes = suffixes
+
+    def __repr__(self):
+        return f"TradingCalendar({self.name})"
+
+    def is_session(self, day: datetime.date) -> bool:
+        return day.weekday() < 5 and day not in self.holidays(day.year)
+
+    def local_date(self, time_: float) -> datetime.date:
+        """Date at TIME_ in the time zone of the exchange."""
+        return pd.Timestamp(time_, unit='s', tz='UTC').tz_convert(self.tz).date()
+
+    def close_at(self, day: datetime.date) -> float:
+        """Closing time of the session of DAY."""
+        return pd.Timestamp(datetime.datetime.combine(day, self.close)).tz_localize(self.tz).timestamp()
+
+    def last_session(self, now: Optional[float] = None, delay: float = 0.) -> datetime.date:
+        """Most recent session that closed at least DELAY seconds before NOW (defaults to the current time)."""
+        now = time() if now is None else now
+        day = self.local_date(now)
+        while not (self.is_session(day) and self.close_at(day) + delay <= now):
+            day -= DAY
+        return day
+
+    def next_refresh(self, now: Optional[float] = None, delay: float = 0.) -> float:
+        """First time after NOW that is DELAY seconds after the close of a session."""
+        now = time() if now is None else now
+        day = self.local_date(now) - DAY  # the refresh of yesterday's session may still be due with a long delay.
+        while not (self.is_session(day) and self.close_at(day) + delay > now):
+            day += DAY
+        return self.close_at(day) + delay
+
+
+def session_time(day: datetime.date) -> int:
+    """Epoch seconds of a session date as stored in the DB, midnight UTC."""
+    return int(datetime.datetime(day.year, day.month, day.day, tzinfo=datetime.timezone.utc).timestamp())
+
+
+CALENDARS = {
+    'NYSE': TradingCalendar('NYSE', 'America/New_York', datetime.time(16), nyse_holidays),
+    'XETRA': TradingCalendar('XETRA', 'Europe/Berlin', datetime.time(17, 30), xetra_holidays, suffixes=('.DE',)),
+    # floor trading of the Frankfurt Stock Exchange follows the holidays of XETRA but closes later.
+    'FRA': TradingCalendar('FRA', 'Europe/Berlin', datetime.time(22), xetra_holidays, suffixes=('.F',)),
+}
+
+
+def calendar_of(ticker: AnyStr) -> TradingCalendar:
+    """Calendar of the exchange of TICKER given its suffix, symbols without a known suffix are US listings."""
+    for calendar in CALENDARS.values():
+        if calendar.suffixes and ticker.upper().endswith(calendar.suffixes):
+            return calendar
+    return CALENDARS['NYSE']
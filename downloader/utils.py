@@ -1,16 +1,114 @@
 import logging
 import os
-from typing import Union, AnyStr
+import random
+import threading
+import time
+from typing import Union, AnyStr, Callable, Any, List, Dict, Optional
 import datetime
 from urllib.error import URLError
-import yfinance as yf
 from portfolio.utils import get_logger
+from downloader.sources import get_source
 
 import pandas as pd
 
 logger = get_logger(__name__)
 
 
+class RateLimiter:
+    """
+    Token bucket limiting the rate of calls to an external service. Tokens are refilled at RATE per second up to
+    BURST, each call takes one token and blocks until one is available. Thread-safe.
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        """
+        Args:
+            rate: Number of calls allowed per second on average.
+            burst: Number of calls that can be made at once after an idle period.
+        """
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: int = 1) -> float:
+        """
+        Takes TOKENS tokens, waiting for them when the bucket does not hold enough.
+        Returns:
+            Seconds waited.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            self.tokens -= tokens
+            # a negative balance is the debt of this call, tokens are reserved in order of arrival.
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+
+# throttles the calls to Yahoo Finance so that we are not blacklisted, see yf_call.
+yf_limiter = RateLimiter(rate=float(os.environ.get('BENCHMARK_YF_RATE', 0.5)), burst=5)
+
+
+def retry(fun: Callable, *args, retries: int = 3, backoff: float = 1., max_backoff: float = 60., **kwargs) -> Any:
+    """
+    Calls FUN with ARGS and KWARGS, retrying when it raises. Attempts are separated by an exponential backoff with full
+    jitter, so that failing workers do not retry all at once.
+    Args:
+        retries: Number of retries, the exception of the last attempt is raised.
+        backoff: Upper bound in seconds of the first delay, doubled after each attempt.
+        max_backoff: Upper bound of the delays.
+    """
+    for attempt in range(retries + 1):
+        try:
+            return fun(*args, **kwargs)
+        except Exception as err:
+            if attempt == retries:
+                raise
+            delay = random.uniform(0, min(max_backoff, backoff * 2 ** attempt))
+            logger.warning(f"{fun.__name__} failed ({err}), attempt {attempt + 1}/{retries + 1}, "
+                           f"retrying in {delay:.1f}s.")
+            time.sleep(delay)
+
+
+class Progress:
+    """
+    Progress and throughput of an update cycle, shared by the workers. Logged at most every INTERVAL seconds.
+    """
+
+    def __init__(self, total: int, interval: float = 10.):
+        self.total = total
+        self.interval = interval
+        self.done = 0
+        self.failed = 0
+        self.rows = 0
+        self.started_at = time.monotonic()
+        self.reported_at = self.started_at
+        self._lock = threading.Lock()
+
+    def update(self, rows: int = 0, failed: bool = False):
+        """Counts a processed ticker, with ROWS new rows."""
+        with self._lock:
+            self.done += 1
+            self.failed += int(failed)
+            self.rows += rows
+        self.report()
+
+    def report(self, force: bool = False):
+        with self._lock:
+            now = time.monotonic()
+            if not force and now - self.reported_at < self.interval:
+                return
+            self.reported_at = now
+            elapsed = max(now - self.started_at, 1e-9)
+            logger.info(f"Progress: {self.done}/{self.total} tickers ({self.failed} failed), {self.rows} new rows, "
+                        f"{self.done / elapsed:.2f} tickers/s, {self.rows / elapsed:.0f} rows/s.")
+
+
 def get_all_tickers() -> Union[pd.Series, None]:
     """
     Gets all tickers listed in the Nasdaq exchange from their public ftp server.
@@ -19,13 +117,10 @@ def get_all_tickers() -> Union[pd.Series, None]:
         (None or Series): A pandas series of Nasdaq listed tickers.
     """
 
-    # an alternative ticker list, maybe be merge this with the one above.
-    # url = 'ftp://ftp.nasdaqtrader.com/SymbolDirectory/otherlisted.txt'
     cached_file = './benchmark/downloader/tickers/nasdaq.csv'
-    url = 'ftp://ftp.nasdaqtrader.com/SymbolDirectory/nasdaqlisted.txt'
     try:
         logger.info('Connecting to Nasdaq servers to fetch ticker list.')
-        df = pd.read_csv(url, sep='|', skipfooter=1)
+        df = get_source().listed_tickers()
         # df can still be returned empty
         if df.empty:
             logger.info("Returned dataframe is empty.")
@@ -38,7 +133,6 @@ def get_all_tickers() -> Union[pd.Series, None]:
 
     except (URLError, ValueError) as error:
         logging.error(error)
-        logging.error(f'URL {url}')
         logging.warning("Attempt to load cached tickers.")
         if os.path.exists(cached_file):
             df = pd.read_csv(cached_file)
@@ -60,24 +154,56 @@ def yf_call(ticker: AnyStr,
         dataframe:  a standard DF with Close, ticker columns indexed on date.
     """
 
+    waited = yf_limiter.acquire()
+    if waited > 0:
+        logger.info(f"Throttled the YF call for {waited:.1f}s.")
     logger.info(f"Making a direct YF call for ticker: {ticker} and start_date: {start}")
-    t = yf.Ticker(ticker)
-    df = t.history(start=start.strftime('%Y-%m-%d'), interval='1d')
-    # make it fucking sure that start is start and that no previous days are included.
+    df = get_source().history(ticker, start)
+    return standardize(df, ticker, start)
+
+
+def yf_call_many(tickers: List[AnyStr],
+                 start: datetime = datetime.datetime.strptime('1900-01-01', '%Y-%m-%d')) -> Dict[AnyStr, pd.DataFrame]:
+    """
+    Same as yf_call for many tickers with the same START, downloaded at once with yfinance's multi-ticker download.
+    Yahoo serves one symbol per request, each ticker takes one token of the rate limiter.
+    Args:
+        tickers: ticker symbols
+        start: (datetime) when not given complete dataset is returned.
+    Returns:
+        A dict of ticker: standard DF with Close, ticker columns indexed on date, empty when YF has no data.
+    """
+    return {ticker: standardize(df, ticker, start) for ticker, df in yf_download(tickers, start).items()}
 
+
+def yf_download(tickers: List[AnyStr], start: datetime,
+                limiter: Optional[RateLimiter] = None) -> Dict[AnyStr, pd.DataFrame]:
+    """
+    Raw YF data of TICKERS from START on, see yf_call_many. The call is throttled by LIMITER, yf_limiter by default.
+    """
+    waited = (yf_limiter if limiter is None else limiter).acquire(len(tickers))
+    if waited > 0:
+        logger.info(f"Throttled the YF call for {waited:.1f}s.")
+    logger.info(f"Making a direct YF call for {len(tickers)} tickers and start_date: {start}")
+    return get_source().download(tickers, start)
+
+
+def standardize(df: pd.DataFrame, ticker: AnyStr, start: datetime) -> pd.DataFrame:
+    """
+    Adapts the output of YF for TICKER to a standard DF with Close, ticker columns indexed on date.
+    """
+    # make it fucking sure that start is start and that no previous days are included.
     df = df.loc[df.index > start]
 
     # Adapt YF output to benchmark standards.
     df = df["Close"]     # take only close. alternative could be open, high, low
-    if not df.empty:
-        df.index.name = 'date'
-        df = df.reset_index()
-        # add the ticker as a column
-        df['ticker'] = ticker
-        # datatypes, convert unserializable datetime columns to integer
-        df['date'] = df['date'].astype('int64') // 1e9
-        df.ticker = df.ticker.astype("category")
-        df.Close = df.Close.astype(float)
-        df = df.set_index('date')
-
+    df.index.name = 'date'
+    df = df.reset_index()
+    # add the ticker as a column
+    df['ticker'] = ticker
+    # datatypes, convert unserializable datetime columns to integer
+    df['date'] = df['date'].astype('int64') // 1e9
+    df.ticker = df.ticker.astype("category")
+    df.Close = df.Close.astype(float)
+    df = df.set_index('date')
     return df
@@ -0,0 +1,192 @@
+"""Asynchronous reads from running ES cluster, to fetch the tickers of a portfolio concurrently."""
+from typing import Optional, List, AnyStr, Union, Dict
+from elasticsearch import NotFoundError
+from elasticsearch import ConnectionError as ESConnectionError
+import pandas as pd
+import asyncio
+from portfolio import utils
+from portfolio.Database import DB, get_db
+from downloader import utils as downloader
+
+
+def is_available() -> bool:
+    """
+    True when AsyncDB can be used: the async extra of elasticsearch (aiohttp) is installed and no event loop is
+    already running in this thread, which the synchronous facade read_many would need to block.
+    """
+    try:
+        import aiohttp  # noqa: F401
+    except ImportError:
+        return False
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return True
+    return False
+
+
+class AsyncDB:
+    """
+    Asynchronous counterpart of DB built on AsyncElasticsearch. It shares the configuration, the cache tiers, the
+    health state and the background writer of a DB instance, only the requests to the ES cluster are made
+    asynchronously. The client is bound to the event loop it is opened in, use it as an async context manager:
+
+    >>> async with AsyncDB() as adb:
+    ...     prices = await adb.read_all(['AAPL', 'AMZN'])
+
+    Requires the async extra of elasticsearch (`pip install elasticsearch[async]`).
+    """
+    logger = utils.get_logger(__name__)
+
+    def __init__(self, db: Optional[DB] = None, concurrency: int = 8):
+        """
+        Args:
+            db: DB instance to share the configuration and caches with, defaults to the one of the process.
+            concurrency: Maximum number of tickers read at the same time.
+        """
+        self.db = get_db() if db is None else db
+        if not isinstance(self.db, DB):
+            raise TypeError(f"AsyncDB reads from an ES cluster, not from a {type(self.db).__name__} backend.")
+        self.concurrency = concurrency
+        self.client = None
+
+    async def __aenter__(self):
+        from elasticsearch import AsyncElasticsearch  # optional dependency.
+        self.client = AsyncElasticsearch("http://elastic:changeme@" + self.db.hostname, maxsize=self.concurrency)
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.client.close()
+        self.client = None
+
+    async def read(self, ticker: AnyStr,
+                   date: Optional[List] = None,
+                   index_name: Optional[AnyStr] = "time-series",
+                   output_format: Optional[AnyStr] = "raw",
+                   fill_na: bool = True) -> Union[pd.Series, pd.DataFrame]:
+        """
+        Same as DB.read. With a local disk cache, DB.read is run in a worker thread as the data is mostly served from
+        the disk.
+        """
+        if self.db.disk_cache is not None:
+            return await asyncio.get_running_loop().run_in_executor(None, self.db.read, ticker, date, index_name,
+                                                                    output_format, fill_na)
+
+        # the DF to return when ES cluster is not reachable, see DB.read.
+        df = pd.DataFrame(data=1,
+                          columns=pd.Index(['ticker', 'Close'], name=ticker),
+                          index=pd.Index(date if date is not None else [], name='date'))
+        df.ticker = df.ticker.astype("category")
+
+        memory_cache = self.db.memory_cache
+        history = memory_cache.get((index_name, ticker)) if memory_cache is not None else None
+        if history is not None:
+            self.logger.info(f'Reading ticker {ticker} from the memory cache.')
+        else:
+            try:
+                if await self.ready(index_name):
+                    if memory_cache is not None:
+                        history = await self.read_es(ticker, None, index_name)
+                        if not history.empty:
+                            memory_cache.put((index_name, ticker), history)
+                    else:
+                        df = await self.read_es(ticker, date, index_name)
+            except ESConnectionError as err:
+                self.db.mark_offline(err)
+
+        if history is not None:
+            # the cached history must not be modified in place by the caller.
+            df = self.db.align(history, ticker, date) if date is not None else history.copy()
+        if output_format == "series":
+            df = self.db.convert(df)
+        if fill_na and not df.empty:
+            df = df.ffill()
+        return df
+
+    async def ready(self, index_name: AnyStr) -> bool:
+        """
+        True when the ES cluster is reachable and INDEX_NAME is set up. The health check and the index setup of the
+        DB make blocking requests, they are run in a worker thread instead of on the event loop.
+        """
+        def check() -> bool:
+            if not self.db.is_online():
+                return False
+            self.db.setup_es_index(index_name=index_name)
+            return True
+        return await asyncio.get_running_loop().run_in_executor(None, check)
+
+    async def read_es(self, ticker: AnyStr, date: Optional[List], index_name: AnyStr) -> pd.DataFrame:
+        """
+        Same as DB.read_es, the direct YF call of tickers that are not stored is made in a worker thread.
+        """
+        future = self.db.pending_writes.get((index_name, ticker))
+        if future is not None:
+            self.logger.info(f"Waiting for the background write of {ticker}.")
+            await asyncio.wait([asyncio.wrap_future(future)])
+        df = await self.query_es(index_name, ticker, date)
+        self.db.check_duplicates(df, ticker, date)
+        if df.empty or df.loc[:, 'Close'].isna().all():
+            self.logger.info(f"DB does not contain data for {ticker}, will make a direct YF call.")
+            df_yf = await asyncio.get_running_loop().run_in_executor(None, downloader.yf_call, ticker)
+            if not df_yf.empty:
+                self.db.write_async(index_name, df_yf)
+                df_yf.index = df_yf.index.astype(int)
+                df = self.db.align(df_yf, ticker, date)
+                df.columns.name = ticker
+        return df
+
+    async def query_es(self, index_name: AnyStr, ticker: AnyStr, date: Optional[List],
+                       after: Optional[int] = None) -> pd.DataFrame:
+        """
+        Same as DB.query_es.
+        """
+        from elasticsearch.helpers import async_scan  # optional dependency.
+        s = self.db.search(index_name, [ticker], date, after)
+        try:
+            hits = [hit['_source'] async for hit in async_scan(self.client, query=s.to_dict(),
+                                                                index=self.db.storage_index(index_name))]
+            hits = self.db.split_buckets(hits, after)
+        except NotFoundError as err:
+            self.logger.error(err)
+            hits = None
+        return self.db.rows_to_frame(hits, ticker, date, index_name)
+
+    async def write(self, index_name: AnyStr, df: pd.DataFrame, **kwargs) -> bool:
+        """
+        Same as DB.write, which is run in a worker thread. Bulk requests are already sent by a pool of threads.
+        """
+        return await asyncio.get_running_loop().run_in_executor(None, lambda: self.db.write(index_name, df, **kwargs))
+
+    async def read_all(self, tickers: List[AnyStr],
+                       date: Optional[List] = None,
+                       index_name: Optional[AnyStr] = "time-series",
+                       fill_na: bool = True) -> Dict[AnyStr, pd.Series]:
+        """
+        Reads TICKERS concurrently, at most `concurrency` of them at the same time.
+
+        Returns:
+            A dict of ticker: series of Close values indexed on date, see DB.read.
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def read_one(ticker: AnyStr) -> pd.Series:
+            async with semaphore:
+                return await self.read(ticker, date, index_name, output_format='series', fill_na=fill_na)
+
+        series = await asyncio.gather(*[read_one(ticker) for ticker in tickers])
+        return dict(zip(tickers, series))
+
+
+def read_many(tickers: List[AnyStr],
+              date: Optional[List] = None,
+              index_name: Optional[AnyStr] = "time-series",
+              fill_na: bool = True,
+              concurrency: int = 8,
+              db: Optional[DB] = None) -> Dict[AnyStr, pd.Series]:
+    """
+    Synchronous facade of AsyncDB.read_all, reads TICKERS concurrently in a new event loop.
+    """
+    async def run():
+        async with AsyncDB(db, concurrency) as adb:
+            return await adb.read_all(tickers, date, index_name, fill_na)
+    return asyncio.run(run())
@@ -0,0 +1,169 @@
+"""Local cache tiers sitting in front of the ES cluster."""
+from typing import AnyStr, Optional, Tuple, Union, Hashable, Any, Dict
+from collections import OrderedDict
+from portfolio import utils
+from time import time
+import pandas as pd
+import numpy as np
+import threading
+import shutil
+import os
+
+
+class DiskCache:
+    """
+    Persistent columnar cache of ticker time-series. Each ticker of an index is stored as a pair of .npy files, one for
+    the dates (epoch seconds) and one for the Close values, which are memory-mapped on read. The last cached date is
+    the watermark: new data is only ever appended after it.
+    """
+    logger = utils.get_logger(__name__)
+
+    def __init__(self, cache_dir: AnyStr):
+        """
+        Args:
+            cache_dir: Directory where the .npy files are stored, created when missing.
+        """
+        self.cache_dir = cache_dir
+
+    def paths(self, index_name: AnyStr, ticker: AnyStr) -> Tuple[AnyStr, AnyStr]:
+        """Paths of the date and Close files of a ticker."""
+        name = ticker.replace(os.sep, '_')
+        folder = os.path.join(self.cache_dir, index_name)
+        return os.path.join(folder, f"{name}.date.npy"), os.path.join(folder, f"{name}.close.npy")
+
+    def has(self, index_name: AnyStr, ticker: AnyStr) -> bool:
+        return all([os.path.exists(path) for path in self.paths(index_name, ticker)])
+
+    def read(self, index_name: AnyStr, ticker: AnyStr) -> Optional[pd.Series]:
+        """
+        Returns the cached Close series of a ticker indexed on date, or None when the ticker is not cached.
+        """
+        if not self.has(index_name, ticker):
+            return None
+        date_path, close_path = self.paths(index_name, ticker)
+        try:
+            dates = np.load(date_path, mmap_mode='r')
+            closes = np.load(close_path, mmap_mode='r')
+        except (OSError, ValueError) as err:
+            self.logger.error(f"Cannot load cached {ticker}: {err}")
+            return None
+        if dates.shape != closes.shape:  # a write was interrupted between the two files.
+            self.logger.warning(f"Cached files of {ticker} are inconsistent, ignoring them.")
+            return None
+        return pd.Series(closes, index=pd.Index(dates, name='date'), name=ticker)
+
+    def watermark(self, index_name: AnyStr, ticker: AnyStr) -> Optional[int]:
+        """Last cached date of a ticker, None when the ticker is not cached."""
+        s = self.read(index_name, ticker)
+        return None if (s is None or s.empty) else int(s.index[-1])
+
+    def append(self, index_name: AnyStr, data: Union[pd.Series, pd.DataFrame]) -> int:
+        """
+        Appends the rows of DATA coming after the watermark of the ticker to its cached series.
+        Args:
+            index_name: name of the index the data is coming from.
+            data: a series named after the ticker, or a standard DF with Close, ticker columns indexed on date.
+        Returns:
+            Number of appended rows.
+        """
+        if type(data) is pd.DataFrame:
+            ticker = data.columns.name if data.empty else str(data['ticker'].iloc[0])
+            data = data['Close']
+        else:
+            ticker = data.name
+        data = data.dropna()
+        data = data[~data.index.duplicated(keep='last')].sort_index()
+
+        cached = self.read(index_name, ticker)
+        if cached is not None and not cached.empty:
+            data = data[data.index > cached.index[-1]]
+        if data.empty:
+            return 0
+
+        if cached is not None and not cached.empty:
+            dates = np.concatenate([np.asarray(cached.index, dtype=np.int64), np.asarray(data.index, dtype=np.int64)])
+            closes = np.concatenate([np.asarray(cached.values, dtype=float), np.asarray(data.values, dtype=float)])
+        else:
+            dates = np.asarray(data.index, dtype=np.int64)
+            closes = np.asarray(data.values, dtype=float)
+
+        date_path, close_path = self.paths(index_name, ticker)
+        os.makedirs(os.path.dirname(date_path), exist_ok=True)
+        # write to temporary files first so that readers never see half written files.
+        for path, values in [(close_path, closes), (date_path, dates)]:
+            np.save(path + '.tmp.npy', values)
+            os.replace(path + '.tmp.npy', path)
+        self.logger.info(f"Cached {data.shape[0]} new rows for {ticker}, watermark is now {dates[-1]}.")
+        return data.shape[0]
+
+    def invalidate(self, index_name: AnyStr, ticker: Optional[AnyStr] = None):
+        """Removes a ticker from the cache, or the whole index when no ticker is given."""
+        if ticker is None:
+            shutil.rmtree(os.path.join(self.cache_dir, index_name), ignore_errors=True)
+            return
+        for path in self.paths(index_name, ticker):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+class LRUCache:
+    """
+    Bounded in-process cache. When full the least recently used entry is evicted, entries older than the time-to-live
+    are evicted on access. Hits, misses and evictions are counted to monitor its efficiency.
+    """
+    logger = utils.get_logger(__name__)
+
+    def __init__(self, maxsize: int = 128, ttl: Optional[float] = None):
+        """
+        Args:
+            maxsize: Maximum number of entries.
+            ttl: Time-to-live of an entry in seconds, entries never expire when None.
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()  # key: (insertion time, value)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key: Hashable):
+        return self.get(key, count=False) is not None
+
+    def get(self, key: Hashable, count: bool = True) -> Optional[Any]:
+        """Returns the cached value of KEY or None, COUNT controls whether the access is counted as hit/miss."""
+        with self._lock:
+            if key in self._data:
+                stored_at, value = self._data[key]
+                if self.ttl is None or time() - stored_at <= self.ttl:
+                    self._data.move_to_end(key)
+                    self.hits += 1 if count else 0
+                    return value
+                del self._data[key]  # expired
+                self.evictions += 1
+            self.misses += 1 if count else 0
+            return None
+
+    def put(self, key: Hashable, value: Any):
+        with self._lock:
+            self._data[key] = (time(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                evicted, _ = self._data.popitem(last=False)
+                self.evictions += 1
+                self.logger.debug(f"Evicted {evicted} from the cache.")
+
+    def invalidate(self, key: Optional[Hashable] = None):
+        """Removes KEY from the cache, or all entries when no key is given."""
+        with self._lock:
+            if key is None:
+                self._data.clear()
+            else:
+                self._data.pop(key, None)
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions, 'size': len(self._data)}
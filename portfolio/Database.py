@@ -1,43 +1,79 @@
 """Utility for read/write to running ES cluster."""
-from typing import Optional, List, AnyStr, Union
+from typing import Optional, List, AnyStr, Union, Set, Iterator, Dict
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor, Future, wait
 import portfolio.utils as utils
-from elasticsearch import Elasticsearch, helpers, NotFoundError
+from elasticsearch import Elasticsearch, helpers, NotFoundError, TransportError
+from elasticsearch import ConnectionError as ESConnectionError
 from elasticsearch_dsl import Index, Search
 import random
 import pandas as pd
-import json
+import numpy as np
 from downloader import utils
-from time import sleep
+from time import sleep, time
+from functools import lru_cache
 from portfolio import es_query_collection as qe
+from portfolio.es_index_templates import templates
+from portfolio.Cache import DiskCache, LRUCache
+import os
 
 random.seed("die kartoffeln")
 
+# bulk item statuses worth a retry: the cluster is overloaded or temporarily not reachable.
+RETRY_STATUS = (429, 502, 503, 504, 'N/A')
+# storage layouts: one document per ticker and day, or per ticker and year/month (see es_index_templates.bucketed).
+BUCKET_FORMATS = {'yearly': '%Y', 'monthly': '%Y-%m'}
+LAYOUTS = ['daily'] + list(BUCKET_FORMATS)
+# number of buckets fetched per mget request when merging new days into stored buckets.
+MGET_SIZE = 1000
 
-class DB:
+
+class BaseDB(ABC):
     """
-    Read-write interface to ES cluster for tickers.
+    Backend-neutral part of the DB: reads served from the cache tiers or from the storage backend, with a direct YF
+    call for tickers that are not stored, and background writes. Backends implement the storage primitives
+    (setup_es_index, scan_rows, write, delete_ticker, list_tickers, last_dates).
     """
     logger = utils.get_logger(__name__)
+    # errors of a failed request to the storage backend, after which it is considered offline.
+    connection_errors = ()
 
-    def __init__(self, hostname="localhost:9200"):
-        self.hostname = hostname
-        self.client = Elasticsearch("http://elastic:changeme@" + self.hostname)
-
+    def __init__(self, cache_dir: Optional[AnyStr] = None, memory_cache_size: Optional[int] = None,
+                 memory_cache_ttl: Optional[float] = None):
+        """
+        Args:
+            cache_dir: Directory of the local on-disk cache, defaults to the BENCHMARK_CACHE_DIR environment variable.
+            When neither is set, the disk cache is disabled.
+            memory_cache_size: Number of ticker histories kept in memory, defaults to the BENCHMARK_MEMORY_CACHE_SIZE
+            environment variable or 0, which disables the memory cache. Without cache tiers only the requested dates
+            are read from the backend, with them the full history of a ticker is read once.
+            memory_cache_ttl: Seconds after which a ticker history in memory is read again, never when None.
+        """
+        self.online = True  # last known health state of the backend, see is_online.
+        self.checked_at = None
+        self.ready_indices = set()  # indices that are known to exist.
+        cache_dir = os.environ.get('BENCHMARK_CACHE_DIR') if cache_dir is None else cache_dir
+        if memory_cache_size is None:
+            memory_cache_size = int(os.environ.get('BENCHMARK_MEMORY_CACHE_SIZE', 0))
+        self.disk_cache = DiskCache(cache_dir) if cache_dir else None
+        self.memory_cache = LRUCache(memory_cache_size, memory_cache_ttl) if memory_cache_size > 0 else None
+        self.writer = None  # executor of the background writes, created on first use, see write_async.
+        self.pending_writes = dict()  # (index, ticker): future of its background write.
+        self.failed_writes = list()  # tickers of the background writes that failed since the last flush.
+
+    def is_online(self) -> bool:
+        """Health state of the storage backend, embedded backends are always reachable."""
+        return self.online
+
+    def mark_offline(self, err: Exception):
+        """Marks the backend as offline after a failed request, it is checked again after a while, see is_online."""
+        self.logger.error(f"Request to the DB failed, considering it offline: {err}")
+        self.online = False
+        self.checked_at = time()
+
+    @abstractmethod
     def setup_es_index(self, index_name: str) -> bool:
-        """Creates indices with INDEX_NAME using elasticsearch CLIENT"""
-        if not self.client.indices.exists(index=index_name):
-            self.logger.info(f"Setting up index_name {index_name} on {self.client.info()['cluster_name']}.")
-            index = Index(index_name, self.client)
-            index.settings(
-                number_of_shards=1,
-                number_of_replicas=1, )
-            # ignore already exists error
-            index.create(ignore=400)
-            self.logger.info("done")
-            return True
-        else:
-            self.logger.info("Index exists already")
-            return False
+        """Creates the storage of INDEX_NAME when missing, returns True when it was created."""
 
     def read(self, ticker: str,
              date: Optional[List] = None,
@@ -47,6 +83,10 @@ class DB:
         """
         Returns data for a given ticker either from the ES, fallbacks to direct call to YF.
         If a ticker is not stored in the DB, it will make a direct YF call and write the data to DB.
+        When the memory cache is enabled, the complete history of recently read tickers is kept in memory and
+        requested dates are sliced out of it. When a local disk cache is configured, data is served from it and only
+        the dates after its watermark are read from the ES. The disk cache is also used when the ES cluster is not
+        reachable.
 
         Args:
             output_format: "raw" returns a dataframe, "series" returns a series, defaults to raw.
@@ -65,30 +105,29 @@ class DB:
                           index=pd.Index(date if date is not None else [], name='date'))
         df.ticker = df.ticker.astype("category")
 
-        if self.client.ping():  # if ES cluster reachable, get data from it:
-            self.setup_es_index(index_name=index_name)  # TODO: move this to the init stage
-            # there are 3 possible outcomes here if the db is online:
-            # (1) df is returned empty because it was not in the database.
-            # (2) df is not empty, but does not contain data at the required date.
-            # (3) df is not empty, and it contains the required date.
-            self.logger.info(f'Reading ticker {ticker} from index {index_name}')
-            df = self.query_es(index_name, ticker, date)
-            #  Duplicate detection
-            if df.index.duplicated().sum() > 0:
-                raise Exception(f'There are duplicated in the DB {ticker}, asked for {len(date)} date points but got '
-                                f'{df.shape[0]}. Date:\n{date},\nTicker:{ticker}\nDuplicates: {df.duplicated().index}')
-
-            if df.empty or df.loc[:, 'Close'].isna().all():
-                self.logger.info(f"DB does not contain data for {ticker} at the required date {date}, "
-                                 f"will make a direct YF call.")
-                # call YF directly via downloader.
-                df = utils.yf_call(ticker)
-                self.logger.info(f"YF call  returned a df of size {df.shape}, we will cache this for future uses.")
-
-                self.write(index_name, df)
-                self.logger.info(f"Sleeping 5s, before re-query.")
-                sleep(5)
-                df = self.query_es(index_name, ticker, date)
+        # full ticker history, when it can be served from one of the cache tiers.
+        history = self.memory_cache.get((index_name, ticker)) if self.memory_cache is not None else None
+        if history is not None:
+            self.logger.info(f'Reading ticker {ticker} from the memory cache.')
+        elif self.is_online():  # if ES cluster reachable, get data from it:
+            try:
+                self.setup_es_index(index_name=index_name)
+                if self.disk_cache is not None or self.memory_cache is not None:
+                    history = self.read_history(ticker, index_name)
+                    if self.memory_cache is not None and not history.empty:
+                        self.memory_cache.put((index_name, ticker), history)
+                else:
+                    df = self.read_es(ticker, date, index_name)
+            except self.connection_errors as err:
+                self.mark_offline(err)
+        if history is None and not self.online and self.disk_cache is not None \
+                and self.disk_cache.has(index_name, ticker):
+            self.logger.warning(f"ES cluster is not reachable, reading {ticker} from the local cache.")
+            history = self.convert(self.disk_cache.read(index_name, ticker))
+
+        if history is not None:
+            # the cached history must not be modified in place by the caller.
+            df = self.align(history, ticker, date) if date is not None else history.copy()
 
         # if series is wanted than process it and convert it
         if output_format is "series":
@@ -98,41 +137,248 @@ class DB:
             df.fillna(method='ffill', inplace=True)
         return df
 
-    def write(self, index_name: AnyStr, df: pd.DataFrame) -> bool:
+    def read_es(self, ticker: AnyStr, date: Optional[List], index_name: AnyStr) -> pd.DataFrame:
         """
-        Sends data to ES.
-        Data when sent twice leads to duplication in ES. To prevent this, all ticker data is first deleted
-        before writing.
+        Reads the requested dates of a ticker from the ES without any caching. If the ticker is not stored, it makes a
+        direct YF call and writes the data to DB.
+
+        Returns:
+            A standard DF with Close, ticker columns indexed on date.
+        """
+        # there are 3 possible outcomes here if the db is online:
+        # (1) df is returned empty because it was not in the database.
+        # (2) df is not empty, but does not contain data at the required date.
+        # (3) df is not empty, and it contains the required date.
+        self.logger.info(f'Reading ticker {ticker} from index {index_name}')
+        self.wait_pending(index_name, ticker)
+        df = self.query_es(index_name, ticker, date)
+        self.check_duplicates(df, ticker, date)
+
+        if df.empty or df.loc[:, 'Close'].isna().all():
+            self.logger.info(f"DB does not contain data for {ticker} at the required date {date}, "
+                             f"will make a direct YF call.")
+            # call YF directly via downloader.
+            df_yf = utils.yf_call(ticker)
+            self.logger.info(f"YF call  returned a df of size {df_yf.shape}, we will cache this for future uses.")
+            if not df_yf.empty:
+                # return the downloaded data right away, it is written to the DB in the background.
+                self.write_async(index_name, df_yf)
+                df_yf.index = df_yf.index.astype(int)
+                df = self.align(df_yf, ticker, date)
+                df.columns.name = ticker
+        return df
+
+    @staticmethod
+    def check_duplicates(df: pd.DataFrame, ticker: AnyStr, date: Optional[List]):
+        """Raises when the DB returned several rows for a date of TICKER."""
+        if df.index.duplicated().sum() > 0:
+            raise Exception(f'There are duplicated in the DB {ticker}, asked for '
+                            f'{len(date) if date is not None else "all"} date points but got {df.shape[0]}. '
+                            f'Date:\n{date},\nTicker:{ticker}\nDuplicates: {df.duplicated().index}')
+
+    def read_history(self, ticker: AnyStr, index_name: AnyStr) -> pd.DataFrame:
+        """
+        Complete history of a ticker. When a local disk cache is configured, it is served from the cache which is
+        first topped up with the data stored in the ES after its watermark. Tickers neither cached nor stored in the
+        ES are fetched with a direct YF call, and written to both.
+
+        Returns:
+            A standard DF with Close, ticker columns indexed on date.
+        """
+        self.wait_pending(index_name, ticker)
+        watermark = self.disk_cache.watermark(index_name, ticker) if self.disk_cache is not None else None
+        df = self.query_es(index_name, ticker, None, after=watermark)
+        if df.empty and watermark is None:
+            self.logger.info(f"DB does not contain data for {ticker}, will make a direct YF call.")
+            df_yf = utils.yf_call(ticker)
+            if not df_yf.empty:
+                self.write_async(index_name, df_yf)
+                df = df_yf
+                df.index = df.index.astype(int)
+                df.columns.name = ticker
+        if self.disk_cache is None:
+            return df
+        if not df.empty:
+            self.disk_cache.append(index_name, df)
+
+        cached = self.disk_cache.read(index_name, ticker)
+        return self.convert(cached) if cached is not None else df
+
+    def read_many(self, tickers: List[AnyStr],
+                  date: Optional[List] = None,
+                  index_name: Optional[AnyStr] = "time-series",
+                  fill_na: bool = True) -> pd.DataFrame:
+        """
+        Returns data for many tickers at once, fetched from the ES with a single query. Tickers that are not stored
+        in the DB are read with `read_missing`, which falls back to a direct YF call and caches the result.
+
         Args:
-            index_name: Index name
-            df: Bulk-sends a pandas Series to ES.
+            tickers: (list) Ticker symbols.
+            date: (list) timestamps, epoch seconds. If not given complete historical data is returned.
+            index_name: name of the index_name, defaults to time-series.
+            fill_na: (boolean) If True will forward-fill nans of each ticker. Defaults to True.
 
         Returns:
-            Response object from bulk call.
+            A date x ticker DataFrame of Close values, with one column per requested ticker.
         """
-        # check validity
-        if not set(df.reset_index().columns) == {'date', 'Close', 'ticker'}:
-            self.logger.error('Required columns are not present.')
-            return False
-        self.setup_es_index(index_name=index_name)  # TODO: move this to the init stage
-        actions = [
-            {
-                "_index": index_name,
-                "_type": "_doc",
-                "_id": 'date' + str(int(node['date'])) + 'Close' + str(node['Close']) + 'ticker' + str(node['ticker']),
-                "_source": json.dumps(node)
-            }
-            for node in df.reset_index().to_dict(orient='records')
-        ]
-        try:
+        tickers = list(dict.fromkeys(tickers))  # unique symbols, order preserved.
+        # same as in read, the panel to return when ES cluster is not reachable.
+        panel = pd.DataFrame(data=1.0,
+                             columns=pd.Index(tickers, name='ticker'),
+                             index=pd.Index(date if date is not None else [], name='date'))
+
+        if self.disk_cache is not None and tickers:
+            panel = self.read_many_cached(tickers, date, index_name)
+        elif self.is_online():
+            self.logger.info(f'Reading {len(tickers)} tickers from index {index_name}')
+            try:
+                self.setup_es_index(index_name=index_name)
+                panel = self.query_es_many(index_name, tickers, date)
+            except self.connection_errors as err:
+                self.mark_offline(err)
+                return panel
+            missing = panel.columns[panel.isna().all()].tolist()
+            if missing:
+                self.logger.info(f"DB does not contain data for {missing}.")
+                panel = pd.concat([panel.drop(columns=missing)] + self.read_missing(missing, date, index_name), axis=1)
+                panel = panel.loc[:, tickers] if date is not None else panel.loc[:, tickers].sort_index()
+                panel.index.name = 'date'
+                panel.columns.name = 'ticker'
+
+        if fill_na & (not panel.empty):
+            panel = panel.ffill()
+        return panel
+
+    def read_many_cached(self, tickers: List[AnyStr], date: Optional[List], index_name: AnyStr) -> pd.DataFrame:
+        """
+        read_many with the local disk cache: cached tickers are served from it with `read`, the full histories of the
+        others are fetched with a single query and cached. Tickers that are not stored are read with `read_missing`.
+        """
+        cached = [ticker for ticker in tickers if self.disk_cache.has(index_name, ticker) or
+                  (self.memory_cache is not None and (index_name, ticker) in self.memory_cache)]
+        columns = [self.read(ticker, date, index_name, output_format='series', fill_na=False) for ticker in cached]
+        missing = [ticker for ticker in tickers if ticker not in cached]
+        if missing and self.is_online():
+            self.logger.info(f'Reading the histories of {len(missing)} tickers from index {index_name}')
+            try:
+                self.setup_es_index(index_name=index_name)
+                histories = self.query_es_many(index_name, missing, None)
+            except self.connection_errors as err:
+                self.mark_offline(err)
+                histories = pd.DataFrame(columns=missing)
+            for ticker in histories.columns[histories.notna().any()]:
+                history = histories[ticker].dropna().rename(ticker)
+                self.disk_cache.append(index_name, history)
+                if self.memory_cache is not None:
+                    df = self.convert(history)
+                    df.columns.name = ticker
+                    self.memory_cache.put((index_name, ticker), df)
+                columns.append(history.reindex(pd.Index(date, name='date')) if date is not None else history)
+                missing.remove(ticker)
+        if missing:  # not stored, or the DB is not reachable.
+            columns += self.read_missing(missing, date, index_name) if self.is_online() else \
+                [self.read(ticker, date, index_name, output_format='series', fill_na=False).rename(ticker)
+                 for ticker in missing]
+        panel = pd.concat(columns, axis=1).loc[:, tickers]
+        panel = panel.sort_index() if date is None else panel
+        panel.index.name = 'date'
+        panel.columns.name = 'ticker'
+        return panel
+
+    def read_missing(self, tickers: List[AnyStr], date: Optional[List], index_name: AnyStr) -> List[pd.Series]:
+        """
+        Reads TICKERS not found by read_many with `read`, one by one. The series are named after their ticker, also
+        when they are empty.
+        """
+        return [self.read(ticker, date, index_name, output_format='series', fill_na=False).rename(ticker)
+                for ticker in tickers]
 
-            # then write the new data
-            response = helpers.bulk(self.client, actions)
-            self.logger.info(f"Bulk sending data to ES, got this {response}.")
-            return True
-        except:
-            self.logger.error(f"Bulk sending data to ES failed")
-            return False
+    @abstractmethod
+    def write(self, index_name: AnyStr, df: pd.DataFrame, **kwargs) -> bool:
+        """
+        Writes a standard DF with Close, ticker columns indexed on date.
+
+        Returns:
+            True when all rows were written.
+        """
+
+    def write_async(self, index_name: AnyStr, df: pd.DataFrame) -> Future:
+        """
+        Writes DF to ES in a background thread, see write. The write returns once the documents are searchable, until
+        then reads of the written tickers wait for it, see wait_pending. Pending writes are completed at exit.
+
+        Returns:
+            Future of the write result.
+        """
+        if self.writer is None:
+            self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='es-writer')
+        keys = [(index_name, ticker) for ticker in df['ticker'].unique()]
+
+        def write() -> bool:
+            # failures are recorded before the future completes, so that a flush waiting for it reports them.
+            try:
+                written = self.write(index_name, df, refresh='wait_for')
+            except Exception as err:
+                self.failed_writes.append([k[1] for k in keys])
+                self.logger.error(f"Background write of {[k[1] for k in keys]} to {index_name} failed: {err}")
+                raise
+            if not written:
+                self.failed_writes.append([k[1] for k in keys])
+                self.logger.error(f"Background write of {[k[1] for k in keys]} to {index_name} failed.")
+            return written
+
+        future = self.writer.submit(write)
+        for key in keys:
+            self.pending_writes[key] = future
+
+        def done(f: Future):
+            for k in keys:
+                if self.pending_writes.get(k) is f:
+                    del self.pending_writes[k]
+        future.add_done_callback(done)
+        return future
+
+    def wait_pending(self, index_name: AnyStr, ticker: AnyStr):
+        """Waits for the background write of TICKER, if there is one."""
+        future = self.pending_writes.get((index_name, ticker))
+        if future is not None:
+            self.logger.info(f"Waiting for the background write of {ticker}.")
+            wait([future])
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Waits for the pending background writes.
+        Returns:
+            True when all of them succeeded within TIMEOUT seconds and no background write failed since the last
+            flush.
+        """
+        futures = set(self.pending_writes.values())
+        _, not_done = wait(futures, timeout=timeout)
+        failed, self.failed_writes = self.failed_writes, list()
+        if failed:
+            self.logger.error(f"Background writes of {sum(failed, [])} failed.")
+        return not not_done and not failed
+
+    def cache_written(self, index_name: AnyStr, df: pd.DataFrame):
+        """
+        Merges the rows of a standard DF being written into the histories in the memory cache, the written rows
+        replace cached ones of the same date. Tickers that are not cached are left to be read from the DB.
+        """
+        if self.memory_cache is None:
+            return
+        df = df.loc[df['Close'].notna()]
+        for ticker, rows in df.groupby(df['ticker'].astype(str)):
+            history = self.memory_cache.get((index_name, ticker), count=False)
+            if history is None:
+                continue
+            rows = rows[['ticker', 'Close']].copy()
+            rows.index = rows.index.astype(int)
+            history = pd.concat([history.loc[~history.index.isin(rows.index)], rows]).sort_index()
+            history['ticker'] = ticker
+            history.ticker = history.ticker.astype("category")
+            history.index.name = 'date'
+            history.columns.name = ticker
+            self.memory_cache.put((index_name, ticker), history)
 
     def convert(self, data: Union[pd.Series, pd.DataFrame]):
         """
@@ -163,15 +409,16 @@ class DB:
             df_.ticker = df_.ticker.astype("category")
             return df_
 
-    def query_es(self, index_name: AnyStr, ticker: AnyStr, date: List) -> pd.DataFrame:
+    def query_es(self, index_name: AnyStr, ticker: AnyStr, date: List, after: Optional[int] = None) -> pd.DataFrame:
         """
-        Internal method to query the ES. First the full ticker data is queried and once it is received it is filtered
-        for the requested dates.
+        Internal method to query the ES. The requested dates are sent along with the ticker as a filter so that the
+        cluster only returns the rows that are needed, the result is then aligned on the requested dates.
 
         Args:
             index_name: ES index
             ticker: ticker name
-            date: a list of epoch seconds.
+            date: a list of epoch seconds. If None the full history of the ticker is returned.
+            after: epoch seconds, if given only data strictly after this date is returned.
 
         Returns:
             Either
@@ -189,28 +436,30 @@ class DB:
                 date
                 1650844800  2921.47998   AMZN
 
-            A non-existing ticker:
-                >>> df_ = db.query_es(index_name='time-series',ticker='XXADFAFAFAFEAEFAF',date=[1650844800])
-                2022-05-03 15:25:32,800 - portfolio.Database - ERROR - 'DataFrame' object has no attribute 'date'
+            A non-existing ticker, without dates:
+                >>> df_ = db.query_es(index_name='time-series',ticker='XXADFAFAFAFEAEFAF',date=None)
                 df
                 Empty DataFrame
-                Columns: []
+                Columns: [ticker, Close]
                 Index: []
 
-            When ticker present but no data for the requested date:
+            When ticker not present or no data for the requested date:
                 >>> df_ = db.query_es(index_name='time-series',ticker='AMZN',date=[1650844800])
                 df
                                  Close ticker
                 date
                 1650844800  NaN   AMZN
         """
-        # return all data
-        s = Search(index=index_name).using(self.client).extra(track_total_hits=True).query(qe.matcher(ticker))
-        # res = s.execute()
-        # parse the raw results to pandas DF
-        try:
-            df = pd.DataFrame([hit.to_dict() for hit in s.scan()])
-            # TODO: Does the received and requested tickers match?
+        return self.rows_to_frame(self.scan_rows(index_name, [ticker], date, after), ticker, date, index_name)
+
+    def rows_to_frame(self, hits: Optional[List[Dict]], ticker: AnyStr, date: Optional[List],
+                      index_name: AnyStr) -> pd.DataFrame:
+        """
+        Converts the rows of TICKER returned by scan_rows to a standard DF, see query_es.
+        """
+        # without hits there is nothing to return, unless NaN rows for the requested dates are expected.
+        if hits or (hits is not None and date is not None):
+            df = pd.DataFrame(hits, columns=['date', 'Close', 'ticker'])
             ticker_list = df.ticker.unique().tolist()
 
             # Validations.
@@ -230,29 +479,453 @@ class DB:
             df.set_index('date', inplace=True)
             df.index.name = 'date'
             df.columns.name = ticker
-            # filter the requested time points
-            if date is not None:
-                # left join with a df that contains all the requested time points.
-                # this will automatically create rows of NaN when the data was not present in the DB.
-                # as a side-effect ticker column will also contain nans, that's why I overwrite it that column
-                df = pd.DataFrame(index=pd.Index(date, name='date')).join(df, how='left')
-                df['ticker'] = ticker
-                df.ticker = df.ticker.astype("category")  # need to do this again
-                df.columns.name = ticker
-
-            return df
-        except NotFoundError as err:
-            self.logger.error(err)
-        except AttributeError as err:
-            self.logger.error(err)
+            return self.align(df, ticker, date)
+        self.logger.info(f"No data found for ticker {ticker} in index {index_name}.")
 
         # empty df with standard columns
         df = pd.DataFrame(columns=['ticker', 'Close'], index=pd.Index([], name='date'))
         df.ticker = df.ticker.astype("category")
         return df
 
+    @abstractmethod
+    def scan_rows(self, index_name: AnyStr, tickers: List[AnyStr], date: Optional[List] = None,
+                  after: Optional[int] = None) -> Optional[List[Dict]]:
+        """
+        Rows of TICKERS on the requested dates (possibly more), only the ones strictly after AFTER when given.
+
+        Returns:
+            A list of {date, Close, ticker} rows, None when the index does not exist.
+        """
+
+    @staticmethod
+    def align(df: pd.DataFrame, ticker: AnyStr, date: Optional[List]) -> pd.DataFrame:
+        """
+        Aligns a standard DF on the requested time points. Returns DF unchanged when DATE is None.
+        """
+        if date is None:
+            return df
+        # left join with a df that contains all the requested time points.
+        # this will automatically create rows of NaN when the data was not present in the DB.
+        # as a side-effect ticker column will also contain nans, that's why I overwrite it that column
+        df = pd.DataFrame(index=pd.Index(date, name='date')).join(df, how='left')
+        df['ticker'] = ticker
+        df.ticker = df.ticker.astype("category")  # need to do this again
+        df.columns.name = ticker
+        return df
+
+    def query_es_many(self, index_name: AnyStr, tickers: List[AnyStr], date: Optional[List]) -> pd.DataFrame:
+        """
+        Internal method to query the ES for many tickers with one scroll. Same as query_es, but the hits are pivoted
+        to a date x ticker panel.
+
+        Args:
+            index_name: ES index
+            tickers: ticker names
+            date: a list of epoch seconds. If None the full history of the tickers is returned.
+
+        Returns:
+            A date x ticker DataFrame of Close values. Columns of tickers without data are full of NaNs.
+        """
+        hits = self.scan_rows(index_name, tickers, date)
+        df = pd.DataFrame(hits or [], columns=['date', 'Close', 'ticker'])
+        if date is not None:  # bucketed layouts return whole buckets.
+            df = df.loc[df.date.isin(date)]
+        if df.duplicated(subset=['date', 'ticker']).any():
+            raise Exception(f"There are duplicates in the DB for tickers {df.loc[df.duplicated(), 'ticker'].unique()}")
+        df.date = df.date.astype(int)
+        df.Close = df.Close.astype(float)
+
+        panel = df.pivot(index='date', columns='ticker', values='Close').reindex(columns=tickers)
+        panel = panel.reindex(pd.Index(date, name='date')) if date is not None else panel.sort_index()
+        panel.index = panel.index.astype(int)
+        panel.index.name = 'date'
+        panel.columns.name = 'ticker'
+        return panel
+
+    @abstractmethod
+    def delete_ticker(self, ticker: AnyStr, index: AnyStr = 'time-series'):
+        """Deletes all data of TICKER."""
+
+    @abstractmethod
+    def list_tickers(self, index_name: AnyStr = 'time-series') -> List[AnyStr]:
+        """All tickers stored in INDEX_NAME."""
+
+    @abstractmethod
+    def last_dates(self, index_name: AnyStr = 'time-series',
+                   tickers: Optional[List[AnyStr]] = None) -> Dict[AnyStr, int]:
+        """Last stored date of each ticker in INDEX_NAME (only TICKERS when given), tickers not stored are missing."""
+
+
+class DB(BaseDB):
+    """
+    Read-write interface to ES cluster for tickers.
+    """
+    connection_errors = (ESConnectionError,)
+
+    def __init__(self, hostname="localhost:9200", cache_dir: Optional[AnyStr] = None,
+                 memory_cache_size: Optional[int] = None, memory_cache_ttl: Optional[float] = None,
+                 health_check_interval: float = 30, pool_size: int = 10, layout: Optional[AnyStr] = None):
+        """
+        Args:
+            hostname: host:port of the ES cluster.
+            health_check_interval: Seconds during which the last known health state of the cluster is trusted.
+            pool_size: Number of pooled HTTP connections to the cluster.
+            layout: Storage layout, one of LAYOUTS, defaults to the BENCHMARK_DB_LAYOUT environment variable or daily.
+            With a bucketed layout (yearly, monthly) an index is stored as `<index name>-<layout>`.
+            cache_dir: see BaseDB.
+            memory_cache_size: see BaseDB.
+            memory_cache_ttl: see BaseDB.
+        """
+        super().__init__(cache_dir=cache_dir, memory_cache_size=memory_cache_size, memory_cache_ttl=memory_cache_ttl)
+        self.hostname = hostname
+        self.layout = os.environ.get('BENCHMARK_DB_LAYOUT', 'daily') if layout is None else layout
+        if self.layout not in LAYOUTS:
+            raise ValueError(f"Unknown storage layout {self.layout}, must be one of {LAYOUTS}.")
+        self.client = Elasticsearch("http://elastic:changeme@" + self.hostname, maxsize=pool_size)
+        self.health_check_interval = health_check_interval
+        self.online = False  # last known health state of the cluster, see is_online.
+        self.ticker_fields = dict()  # index: keyword field of the ticker, see ticker_field.
+
+    def is_online(self) -> bool:
+        """
+        Health state of the ES cluster. The cluster is pinged at most once per health_check_interval, in between the
+        last known state is returned. A failing request trips the state to offline, see mark_offline.
+        """
+        if self.checked_at is None or time() - self.checked_at > self.health_check_interval:
+            self.online = self.client.ping()
+            self.checked_at = time()
+            if not self.online:
+                self.logger.warning(f"ES cluster at {self.hostname} is not reachable.")
+        return self.online
+
+    def setup_es_index(self, index_name: str) -> bool:
+        """
+        Creates indices with INDEX_NAME using elasticsearch CLIENT, with the index template from es_index_templates
+        when there is one for INDEX_NAME. The check runs once per index and DB instance.
+        """
+        index_name = self.storage_index(index_name)
+        if index_name in self.ready_indices:
+            return False
+        created = False
+        if not self.client.indices.exists(index=index_name):
+            self.logger.info(f"Setting up index_name {index_name} on {self.client.info()['cluster_name']}.")
+            if index_name in templates:
+                self.client.indices.put_index_template(name=index_name, body=templates[index_name])
+            index = Index(index_name, self.client)
+            index.settings(
+                number_of_shards=1,
+                number_of_replicas=1, )
+            # ignore already exists error
+            index.create(ignore=400)
+            self.logger.info("done")
+            created = True
+        else:
+            self.logger.info("Index exists already")
+        self.ticker_field(index_name)
+        self.ready_indices.add(index_name)
+        return created
+
+    def storage_index(self, index_name: AnyStr) -> AnyStr:
+        """Name of the ES index actually storing INDEX_NAME in the current layout."""
+        return index_name if self.layout == 'daily' else f"{index_name}-{self.layout}"
+
+    def get_ticker_field(self, index_name: AnyStr) -> AnyStr:
+        """
+        Name of the keyword field holding the ticker. Indices created with the template map the ticker as keyword,
+        older ones (or ones without a template) map it as text with a `.keyword` sub-field.
+        """
+        mapping = self.client.indices.get_mapping(index=index_name)
+        properties = next(iter(mapping.values()))['mappings'].get('properties', {})
+        if properties.get('ticker', {}).get('type') == 'keyword':
+            return 'ticker'
+        if index_name in templates:
+            self.logger.warning(f"Index {index_name} was created without its template, re-index it to get a sorted "
+                                f"index with typed fields.")
+        return 'ticker.keyword'
+
+    def ticker_field(self, index_name: AnyStr) -> AnyStr:
+        """
+        Keyword field of the ticker in the ES index INDEX_NAME, looked up once per index with get_ticker_field. A
+        missing index is not looked up: it will be created with its template, which maps the ticker as keyword.
+        """
+        if index_name not in self.ticker_fields:
+            try:
+                self.ticker_fields[index_name] = self.get_ticker_field(index_name)
+            except NotFoundError:
+                return 'ticker'
+        return self.ticker_fields[index_name]
+
+    def read_missing(self, tickers: List[AnyStr], date: Optional[List], index_name: AnyStr) -> List[pd.Series]:
+        """
+        Reads TICKERS not found by read_many with `read`, concurrently with AsyncDB when the async extra of
+        elasticsearch is installed, otherwise one by one.
+        """
+        from portfolio import AsyncDatabase  # imports this module.
+        if AsyncDatabase.is_available():
+            series = AsyncDatabase.read_many(tickers, date, index_name, fill_na=False, db=self)
+            return [series[ticker].rename(ticker) for ticker in tickers]
+        return super().read_missing(tickers, date, index_name)
+
+    def write(self, index_name: AnyStr, df: pd.DataFrame,
+              chunk_size: int = 500,
+              thread_count: int = 4,
+              max_chunk_bytes: int = 10 * 1024 * 1024,
+              queue_size: int = 4,
+              max_retries: int = 3,
+              refresh: Union[bool, AnyStr] = False) -> bool:
+        """
+        Sends data to ES.
+        Documents are generated lazily from DF and streamed to the cluster in chunks by a pool of threads, at most
+        QUEUE_SIZE chunks are waiting to be sent at any time. Documents rejected by the cluster because it is
+        overloaded are retried, the others are reported as failed.
+        Data when sent twice leads to duplication in ES. To prevent this, all ticker data is first deleted
+        before writing.
+        Args:
+            index_name: Index name
+            df: Bulk-sends a standard DF with Close, ticker columns indexed on date to ES.
+            chunk_size: Number of documents per bulk request.
+            thread_count: Number of threads sending bulk requests in parallel.
+            max_chunk_bytes: Maximum size of a bulk request in bytes.
+            queue_size: Number of chunks buffered for the sending threads.
+            max_retries: How many times rejected documents are retried, with an exponential backoff.
+            refresh: Refresh policy of the bulk requests, 'wait_for' returns only once the documents are searchable.
+
+        Returns:
+            True when all documents were written.
+        """
+        # check validity
+        if not {df.index.name, *df.columns} == {'date', 'Close', 'ticker'}:
+            self.logger.error('Required columns are not present.')
+            return False
+        self.setup_es_index(index_name=index_name)
+        self.cache_written(index_name, df)
+
+        ids = None  # documents to send, all of them in the first attempt.
+        written = 0
+        failed = dict()
+        for attempt in range(max_retries + 1):
+            retry = dict()
+            try:
+                actions = self.bulk_actions(self.storage_index(index_name), df, ids) if self.layout == 'daily' \
+                    else self.bucket_actions(self.storage_index(index_name), df, ids)
+                for ok, item in helpers.parallel_bulk(self.client, actions,
+                                                      thread_count=thread_count, chunk_size=chunk_size,
+                                                      max_chunk_bytes=max_chunk_bytes, queue_size=queue_size,
+                                                      raise_on_error=False, raise_on_exception=False,
+                                                      refresh=refresh):
+                    _, info = item.popitem()
+                    if ok:
+                        written += 1
+                    elif info.get('status') in RETRY_STATUS:
+                        retry[info['_id']] = info.get('error')
+                    else:
+                        failed[info['_id']] = info.get('error')
+            except TransportError as err:  # raised before any document could be sent.
+                self.logger.error(f"Bulk sending data to ES failed: {err}")
+                return False
+
+            if not retry:
+                self.logger.info(f"Bulk sent {written} documents to {index_name}.")
+                if failed:
+                    self.logger.error(f"{len(failed)} documents were rejected by ES, e.g. {next(iter(failed.items()))}")
+                return not failed
+            if attempt < max_retries:
+                self.logger.warning(f"ES is overloaded, retrying {len(retry)} rejected documents.")
+                sleep(2 ** attempt)
+                ids = set(retry)
+        self.logger.error(f"{len(retry) + len(failed)} documents could not be written after {max_retries} retries.")
+        return False
+
+    @staticmethod
+    def bulk_actions(index_name: AnyStr, df: pd.DataFrame, ids: Optional[Set[AnyStr]] = None) -> Iterator[Dict]:
+        """
+        Lazily generates an index action for each row of DF, skipping rows without a Close value.
+        Args:
+            index_name: Index name
+            df: a standard DF with Close, ticker columns indexed on date.
+            ids: If given, only the actions of documents with these ids are generated.
+        """
+        for date, close, ticker in zip(df.index, df['Close'].values, df['ticker'].values):
+            if pd.isna(close):
+                continue
+            _id = 'date' + str(int(date)) + 'Close' + str(float(close)) + 'ticker' + str(ticker)
+            if ids is not None and _id not in ids:
+                continue
+            yield {
+                "_index": index_name,
+                "_type": "_doc",
+                "_id": _id,
+                "_source": {'date': int(date), 'Close': float(close), 'ticker': str(ticker)}
+            }
+
+    def bucket_actions(self, index_name: AnyStr, df: pd.DataFrame, ids: Optional[Set[AnyStr]] = None) -> Iterator[Dict]:
+        """
+        Lazily generates an index action for each (ticker, bucket) of DF in a bucketed layout. Days already stored in
+        a bucket are merged with the new ones, new values win. Document ids are deterministic, so that a bucket is
+        overwritten and never duplicated.
+        Args:
+            index_name: Index name
+            df: a standard DF with Close, ticker columns indexed on date.
+            ids: If given, only the actions of documents with these ids are generated.
+        """
+        df = df.loc[df['Close'].notna()]
+        closes = pd.Series(df['Close'].values.astype(float), index=df.index.astype(np.int64))
+        buckets = {f"{ticker}|{bucket}": (ticker, bucket, group) for (ticker, bucket), group in
+                   closes.groupby([df['ticker'].astype(str).values, self.bucket_keys(closes.index)], sort=False)}
+        wanted = [_id for _id in buckets if ids is None or _id in ids]
+        # the stored buckets are fetched in batches, with one request for many tickers.
+        for start in range(0, len(wanted), MGET_SIZE):
+            batch = wanted[start:start + MGET_SIZE]
+            stored = {doc['_id']: doc['_source'] for doc in
+                      self.client.mget(index=index_name, body={'ids': batch})['docs'] if doc.get('found')}
+            for _id in batch:
+                ticker, bucket, group = buckets[_id]
+                if _id in stored:
+                    group = group.combine_first(pd.Series(stored[_id]['Close'], index=stored[_id]['date']))
+                group = group.sort_index()
+                yield {
+                    "_index": index_name,
+                    "_type": "_doc",
+                    "_id": _id,
+                    "_source": {'ticker': ticker, 'bucket': bucket,
+                                'first_date': int(group.index[0]), 'last_date': int(group.index[-1]),
+                                'date': group.index.tolist(), 'Close': group.values.tolist()}
+                }
+
+    def bucket_keys(self, date: List) -> pd.Index:
+        """Bucket of each time point (epoch seconds) in the current layout, e.g. '2021' or '2021-05'."""
+        return pd.to_datetime(np.asarray(date, dtype=np.int64), unit='s').strftime(BUCKET_FORMATS[self.layout])
+
+    def scan_rows(self, index_name: AnyStr, tickers: List[AnyStr], date: Optional[List] = None,
+                  after: Optional[int] = None) -> Optional[List[Dict]]:
+        """
+        Scrolls through the documents of TICKERS, restricted to the requested dates. In a bucketed layout the buckets
+        are split back to one row per day, days of the returned buckets that were not requested may be included.
+
+        Returns:
+            A list of {date, Close, ticker} rows, None when the index does not exist.
+        """
+        s = self.search(index_name, tickers, date, after).using(self.client)
+        # parse the raw results
+        try:
+            hits = [hit.to_dict() for hit in s.scan()]
+        except NotFoundError as err:
+            self.logger.error(err)
+            return None
+        return self.split_buckets(hits, after)
+
+    def search(self, index_name: AnyStr, tickers: List[AnyStr], date: Optional[List] = None,
+               after: Optional[int] = None) -> Search:
+        """Search for the documents of TICKERS on the requested dates, in the storage layout of the DB."""
+        physical = self.storage_index(index_name)
+        s = Search(index=physical).query(qe.matcher_many(tickers, self.ticker_field(physical)))
+        if date is not None:
+            s = s.filter(qe.time_filter(date) if self.layout == 'daily' else qe.bucket_filter(date))
+        if after is not None:
+            s = s.filter(qe.after_filter(after) if self.layout == 'daily' else qe.bucket_after_filter(after))
+        return s
+
+    def split_buckets(self, hits: List[Dict], after: Optional[int] = None) -> List[Dict]:
+        """Splits the documents of a bucketed layout to one {date, Close, ticker} row per day."""
+        if self.layout == 'daily':
+            return hits
+        return [{'date': d, 'Close': c, 'ticker': hit['ticker']}
+                for hit in hits for d, c in zip(hit['date'], hit['Close']) if after is None or d > after]
+
     def delete_ticker(self, ticker: AnyStr, index: AnyStr = 'time-series'):
         # first delete all data
+        self.setup_es_index(index)
+        physical = self.storage_index(index)
+        delete_query = {"query": qe.matcher(ticker, self.ticker_field(physical)).to_dict()}
+        self.client.delete_by_query(index=physical, body=delete_query)
+        if self.disk_cache is not None:
+            self.disk_cache.invalidate(index, ticker)
+        if self.memory_cache is not None:
+            self.memory_cache.invalidate((index, ticker))
+
+    def list_tickers(self, index_name: AnyStr = 'time-series') -> List[AnyStr]:
+        """
+        All tickers stored in INDEX_NAME, collected with a paginated composite aggregation.
+        """
+        self.setup_es_index(index_name)
+        return [bucket['key']['ticker'] for bucket in self.ticker_buckets(index_name)]
+
+    def last_dates(self, index_name: AnyStr = 'time-series',
+                   tickers: Optional[List[AnyStr]] = None) -> Dict[AnyStr, int]:
+        """
+        Last stored date of each ticker in INDEX_NAME, computed by the cluster with one paginated aggregation instead
+        of reading the ticker histories.
+        Args:
+            index_name: ES index
+            tickers: Only these tickers when given, otherwise all stored tickers.
 
-        delete_query = f"""{{"query": {{"match": {{"ticker": "{ticker}"}}}}}}"""
-        self.client.delete_by_query(index=index, body=delete_query)
+        Returns:
+            A dict of ticker: epoch seconds of its last stored date. Tickers that are not stored are missing.
+        """
+        self.setup_es_index(index_name)
+        field = 'date' if self.layout == 'daily' else 'last_date'
+        out = dict()
+        for bucket in self.ticker_buckets(index_name, tickers, {"last": {"max": {"field": field}}}):
+            last = bucket['last']
+            # date fields are returned in milliseconds, formatted according to their mapping (epoch_second).
+            out[bucket['key']['ticker']] = int(float(last.get('value_as_string', last['value'])))
+        return out
+
+    def ticker_buckets(self, index_name: AnyStr, tickers: Optional[List[AnyStr]] = None,
+                       aggs: Optional[Dict] = None) -> Iterator[Dict]:
+        """
+        Buckets of a composite aggregation over the tickers of INDEX_NAME, with the sub-aggregations AGGS. Pages of
+        1000 tickers are requested until all tickers are returned.
+        """
+        physical = self.storage_index(index_name)
+        field = self.ticker_field(physical)
+        composite = {"size": 1000, "sources": [{"ticker": {"terms": {"field": field}}}]}
+        body = {"size": 0, "aggs": {"tickers": {"composite": composite}}}
+        if aggs is not None:
+            body["aggs"]["tickers"]["aggs"] = aggs
+        if tickers is not None:
+            body["query"] = qe.matcher_many(tickers, field).to_dict()
+        while True:
+            aggregation = self.client.search(index=physical, body=body)['aggregations']['tickers']
+            yield from aggregation['buckets']
+            if not aggregation['buckets'] or 'after_key' not in aggregation:
+                return
+            composite['after'] = aggregation['after_key']
+
+    def migrate(self, index_name: AnyStr = 'time-series', layout: AnyStr = 'yearly') -> int:
+        """
+        Copies all tickers of INDEX_NAME from the current layout to LAYOUT, one ticker at a time. The source index is
+        left untouched.
+
+        Returns:
+            Number of migrated tickers.
+        """
+        target = DB(self.hostname, cache_dir='', memory_cache_size=0, layout=layout)
+        tickers = self.list_tickers(index_name)
+        self.logger.info(f"Migrating {len(tickers)} tickers of {index_name} from {self.layout} to {layout} layout.")
+        for i, ticker in enumerate(tickers):
+            df = self.query_es(index_name, ticker, None)
+            if not target.write(index_name, df):
+                raise Exception(f"Migration of {ticker} to the {layout} layout failed.")
+            self.logger.info(f"Migrated {ticker} ({i + 1}/{len(tickers)}), {df.shape[0]} rows.")
+        return len(tickers)
+
+
+@lru_cache(maxsize=None)
+def get_db(hostname: AnyStr = "localhost:9200", backend: Optional[AnyStr] = None) -> BaseDB:
+    """
+    Returns the DB instance shared by all modules of the process, so that they share one pooled client, the health
+    state of the cluster, the index setup and the caches.
+
+    Args:
+        hostname: host:port of the ES cluster.
+        backend: Storage backend, elasticsearch or sqlite (see SQLiteDatabase.SQLiteDB), defaults to the
+        BENCHMARK_DB_BACKEND environment variable or elasticsearch.
+    """
+    backend = os.environ.get('BENCHMARK_DB_BACKEND', 'elasticsearch') if backend is None else backend
+    if backend == 'sqlite':
+        from portfolio.SQLiteDatabase import SQLiteDB  # imports this module.
+        return SQLiteDB()
+    if backend != 'elasticsearch':
+        raise ValueError(f"Unknown storage backend {backend}, must be elasticsearch or sqlite.")
+    return DB(hostname)
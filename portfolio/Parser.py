@@ -5,6 +5,7 @@ from dateutil import parser
 from typing import AnyStr, List, Dict
 from portfolio.Position import Position
 from portfolio.Ticker import Ticker
+from portfolio.Database import get_db
 from collections import defaultdict
 import numpy as np
 
@@ -13,6 +14,8 @@ pd.set_option('display.max_rows', 500)
 pd.set_option('display.max_columns', 500)
 pd.set_option('display.width', 1000)
 
+db = get_db()
+
 # used to map all column names listed in values, to their keys {target column name: export file column name}.
 # the column names listed as values are encountered on the .csv file and then mapped to final column names (shown in
 # keys).
@@ -60,21 +63,28 @@ class PortfolioParser:
         """
         Grouped Ticker objects for each position.
         """
-        d = defaultdict(list)
-        for ticker_name, positions in self.grouped_positions.items():
-            d[ticker_name] = Ticker(positions)
-        return dict(d)
+        return self.load_tickers(self.grouped_positions)
 
     @property
     def tickers(self) -> List[Ticker]:
         """
         A list of Ticker objects, to be fed directly to Portfolio.
         """
-        d = list()
+        return list(self.load_tickers(self.grouped_positions).values())
 
-        for ticker_name, positions in self.grouped_positions.items():
-            d.append(Ticker(positions))
-        return d
+    @staticmethod
+    def load_tickers(grouped_positions: Dict[AnyStr, List[Position]]) -> Dict[AnyStr, Ticker]:
+        """
+        Builds a Ticker for each group of positions. Values of all tickers are read from the DB with a single call,
+        on a time line spanning all positions.
+        """
+        if not grouped_positions:
+            return dict()
+        start = min([pos.date for positions in grouped_positions.values() for pos in positions])
+        time_line = Ticker.make_time_line(start, utils.today())
+        prices = db.read_many(list(grouped_positions.keys()), time_line)
+        return {ticker_name: Ticker(positions, prices=prices[ticker_name])
+                for ticker_name, positions in grouped_positions.items()}
 
     @property
     def grouped_positions_df(self) -> Dict[AnyStr, pd.DataFrame]:
@@ -101,13 +111,16 @@ class PortfolioParser:
     @property
     def positions(self) -> List:
         """
-        Returns: Returns parsed .csv export file as a list of validated Position objects.
+        Returns: Returns parsed .csv export file as a list of validated Position objects. Their costs are read from
+        the DB at once, positions whose cost is not found read it on their own.
         """
 
         def callback(col) -> Position:
-            return Position(col.action, col.quantity, col.ticker, int(col.date))
+            return Position(col.action, col.quantity, col.ticker, int(col.date),
+                            cost=None if np.isnan(col.cost) else col.cost)
 
-        return self.df.T.apply(callback).to_list()
+        costs = Position.values_at(self.df.ticker.astype(str).tolist(), self.df.date.tolist())
+        return self.df.assign(cost=costs).T.apply(callback).to_list()
 
     def parse_file(self, filename: AnyStr) -> pd.DataFrame:
         """
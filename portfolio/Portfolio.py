@@ -1,13 +1,12 @@
-from portfolio.Database import DB
+from portfolio.Database import get_db
 from portfolio.Ticker import Ticker
 from portfolio.Position import Position
-from typing import List
+from typing import Dict, List, Optional
 import pandas as pd
 import numpy as np
 from collections import defaultdict
-import copy
 
-db = DB()
+db = get_db()
 
 
 class Portfolio:
@@ -24,28 +23,55 @@ class Portfolio:
         """
         self.benchmark_symbol = benchmark_symbol
         self.tickers = tickers
+        self._panel = (None, None)  # (key, panel)
 
         # BENCHMARKING:
-        # copy positions and replace all tickers with the benchmark ticker.
-        dummy = copy.deepcopy(tickers)
-        self.benchmark_positions = list()
-        for t in dummy:
-            for p in t.positions:
-                paid = p.cost  # the money that was paid for this position.
-                # cost will be autofilled.
-                pos = Position(ticker=self.benchmark_symbol, action=p.action, quantity=p.quantity, date=p.date,
-                               commission=p.commission)
-                # We need to adjust the quantity to have the same amount of investment.
-                # pos.quantity = paid / pos.cost
-                self.benchmark_positions.append(pos)
+        # new positions with the benchmark ticker, the positions of the tickers are only read.
+        positions = [p for t in tickers for p in t.positions]
+        costs = Position.values_at([self.benchmark_symbol] * len(positions), [p.date for p in positions])
+        self.benchmark_positions = [self.benchmark_position(p, cost) for p, cost in zip(positions, costs)]
         # create now a ne ticker object from the modified positions
         self.benchmark_ticker = Ticker(self.benchmark_positions)
 
+    def benchmark_position(self, p: Position, cost: Optional[float] = None) -> Position:
+        """The same transaction as P with the benchmark ticker, COST is the value of the benchmark at its date."""
+        paid = p.cost  # the money that was paid for this position.
+        # cost will be autofilled when not known.
+        pos = Position(ticker=self.benchmark_symbol, action=p.action, quantity=p.quantity, date=p.date,
+                       cost=None if cost is None or np.isnan(cost) else cost, commission=p.commission)
+        # We need to adjust the quantity to have the same amount of investment.
+        # pos.quantity = paid / pos.cost
+        return pos
+
+    def add_position(self, pos: Position):
+        """
+        Adds a transaction to the ticker it belongs to (a new ticker for a new symbol) and to the benchmark, without
+        rebuilding the other tickers.
+        """
+        tickers = [t for t in self.tickers if t.ticker == pos.ticker]
+        if tickers:
+            tickers[0].add_position(pos)
+        else:
+            self.tickers.append(Ticker([pos], today=self.benchmark_ticker.today))
+        benchmark_pos = self.benchmark_position(pos)
+        self.benchmark_ticker.add_position(benchmark_pos)
+        self.benchmark_positions.append(benchmark_pos)
+
+    def append_prices(self, prices: pd.DataFrame):
+        """
+        Extends the time lines of all tickers and of the benchmark with new days.
+        Args:
+            prices: Ticker values indexed on date, one column per ticker as returned by DB.read_many. Each ticker gets
+            the days after the end of its time line, tickers without a column get NaN values.
+        """
+        for t in self.tickers + [self.benchmark_ticker]:
+            closes = prices[t.ticker] if t.ticker in prices.columns else pd.Series(np.nan, index=prices.index)
+            closes = closes.loc[closes.index > t.time_line[-1]]
+            t.append_prices(closes.index.values, closes.values)
+
     @property
     def benchmark_returns(self):
-        s = self.benchmark_ticker.tc_returns
-        s.name = 'benchmark returns'
-        return s
+        return self.benchmark_ticker.tc_returns.rename('benchmark returns')
 
     @property
     def current_benchmark_returns(self):
@@ -69,16 +95,41 @@ class Portfolio:
                }
         return out
 
+    @property
+    def panel(self) -> Dict[str, np.ndarray]:
+        """
+        Time courses of all tickers stacked on a global day axis, the union of their time lines. Returns, invested
+        money and value are (ticker, day) arrays, NaN where the mask of the days on the time line of a ticker is
+        False. The panel is built again only when a ticker is added or changed, e.g. by add_position or append_prices
+        on the portfolio or on one of its tickers.
+        """
+        key = tuple((id(t), t.version) for t in self.tickers)
+        if self._panel[0] != key:
+            days = np.unique(np.concatenate([t.time_line for t in self.tickers]))
+            shape = (len(self.tickers), len(days))
+            panel = {'days': days, 'mask': np.zeros(shape, dtype=bool), 'last': np.zeros(len(self.tickers), dtype=int)}
+            for name in ['returns', 'invested', 'value']:
+                panel[name] = np.full(shape, np.nan)
+            for i, t in enumerate(self.tickers):
+                columns = np.searchsorted(days, t.time_line)
+                panel['mask'][i, columns] = True
+                panel['last'][i] = columns[-1]
+                for name in ['returns', 'invested', 'value']:
+                    panel[name][i, columns] = getattr(t, f'tc_{name}').values
+            self._panel = (key, panel)
+        return self._panel[1]
+
     # properties are organized to be specific either for tickers or for the portfolio (ie. all tickers).
     @property
     def portfolio_returns(self):
-        a_ = pd.concat([t.tc_returns for t in self.tickers], axis=1)  # returns
-        a = np.ma.array(a_.values, mask=a_.isna())
-        w = pd.concat([t.tc_invested for t in self.tickers], axis=1)  # weights
-        w = np.ma.array(w.values, mask=w.isna())
-        s = pd.Series(np.ma.average(a, axis=1, weights=w), index=a_.index)  # weighted average.
-        s.name = 'portfolio returns'
-        return s
+        # average of the returns weighted by the invested money, over the tickers where both are known.
+        panel = self.panel
+        valid = panel['mask'] & ~np.isnan(panel['returns']) & ~np.isnan(panel['invested'])
+        weights = np.where(valid, panel['invested'], 0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            average = np.sum(np.where(valid, panel['returns'], 0) * weights, axis=0) / np.sum(weights, axis=0)
+        return pd.Series(np.where(valid.any(axis=0), average, np.nan), index=pd.Index(panel['days'], name='date'),
+                         name='portfolio returns')
 
     @property
     def current_portfolio_returns(self):
@@ -107,7 +158,9 @@ class Portfolio:
 
     @property
     def current_gross_value_global(self):
-        return np.nansum([t.current_value for t in self.tickers])
+        # the value of each ticker at the end of its time line.
+        panel = self.panel
+        return np.nansum(panel['value'][np.arange(len(self.tickers)), panel['last']])
 
     @property
     def current_profit_loss_per_ticker(self):
@@ -1,11 +1,11 @@
 import pandas as pd
 from numpy import isnan
-from typing import SupportsFloat, AnyStr, Optional
+from typing import SupportsFloat, AnyStr, Optional, List
 from portfolio import Database
 from portfolio import utils
 import numpy as np
 
-db = Database.DB()
+db = Database.get_db()
 
 
 class Position:
@@ -108,3 +108,36 @@ class Position:
         else:
             self.logger.info(f"This is the dataframe returned:\n{out}")
             raise Exception("The output should only be at most of length 1")
+
+    @staticmethod
+    def values_at(tickers: List[AnyStr], dates: List[int]) -> np.ndarray:
+        """
+        Values of many securities at once, e.g. to prefill the cost of the positions of an export file. All values are
+        read from the DB with a single call. As in value_at, a date without value takes the value of the nearest
+        following day, at most 3 days later.
+        Args:
+            tickers: Ticker of each position.
+            dates: Date of each position, epoch seconds.
+
+        Returns:
+            The value of each position, NaN when none is found.
+        """
+        tickers = np.asarray(tickers, dtype=object)
+        dates = np.asarray(dates, dtype=int)
+        out = np.full(len(dates), np.nan)
+        if len(dates) == 0:
+            return out
+        day = 24 * 60 * 60
+        window = np.unique(dates[:, None] + day * np.arange(4)[None, :])  # dates and the 3 days after them.
+        prices = db.read_many(list(dict.fromkeys(tickers)), window.tolist(), fill_na=False)
+        for ticker in prices.columns:
+            rows = np.flatnonzero(tickers == ticker)
+            known = prices[ticker].dropna().sort_index()
+            if known.empty:
+                continue
+            following = np.searchsorted(known.index.values, dates[rows])  # first day with a value from the date on.
+            found = following < len(known)
+            following = np.minimum(following, len(known) - 1)
+            found &= known.index.values[following] - dates[rows] <= 3 * day
+            out[rows[found]] = known.values[following[found]]
+        return out
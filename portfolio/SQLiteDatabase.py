@@ -0,0 +1,129 @@
+"""Embedded storage backend, an SQLite file instead of the ES cluster."""
+from typing import Optional, List, AnyStr, Dict
+import pandas as pd
+import sqlite3
+import threading
+import os
+from portfolio.Database import BaseDB
+
+# maximum number of ticker parameters of a statement, older SQLite versions accept at most 999 parameters.
+MAX_PARAMETERS = 500
+
+
+class SQLiteDB(BaseDB):
+    """
+    DB storing the time-series in an SQLite file, for deployments without an ES cluster. Each index is a table with
+    a (ticker, date) primary key, the rows of a ticker are stored contiguously and dates are read with range scans.
+    It implements the storage primitives of BaseDB (setup_es_index, scan_rows, write, delete_ticker, list_tickers,
+    last_dates), reads and the cache tiers work the same way on both backends.
+    """
+
+    def __init__(self, path: Optional[AnyStr] = None, cache_dir: Optional[AnyStr] = None,
+                 memory_cache_size: Optional[int] = None, memory_cache_ttl: Optional[float] = None):
+        """
+        Args:
+            path: Path of the SQLite file, created when missing. Defaults to the BENCHMARK_SQLITE_PATH environment
+            variable or ~/.benchmark/benchmark.sqlite.
+            cache_dir: see BaseDB.
+            memory_cache_size: see BaseDB.
+            memory_cache_ttl: see BaseDB.
+        """
+        super().__init__(cache_dir=cache_dir, memory_cache_size=memory_cache_size, memory_cache_ttl=memory_cache_ttl)
+        path = os.environ.get('BENCHMARK_SQLITE_PATH', '~/.benchmark/benchmark.sqlite') if path is None else path
+        self.path = os.path.expanduser(path)
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        # the connection is shared with the background writer, see BaseDB.write_async.
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')  # readers are not blocked by a running db-update.
+        self._lock = threading.Lock()
+
+    def setup_es_index(self, index_name: str) -> bool:
+        """Creates the table of INDEX_NAME, once per DB instance."""
+        if index_name in self.ready_indices:
+            return False
+        with self._lock, self.connection:
+            created = self.connection.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?",
+                                              (index_name,)).fetchone() is None
+            self.connection.execute(f'CREATE TABLE IF NOT EXISTS "{index_name}" '
+                                    f'(ticker TEXT NOT NULL, date INTEGER NOT NULL, Close REAL, '
+                                    f'PRIMARY KEY (ticker, date)) WITHOUT ROWID')
+        self.ready_indices.add(index_name)
+        return created
+
+    def scan_rows(self, index_name: AnyStr, tickers: List[AnyStr], date: Optional[List] = None,
+                  after: Optional[int] = None) -> Optional[List[Dict]]:
+        """
+        Rows of TICKERS between the first and last requested dates, see BaseDB.scan_rows.
+        """
+        if date is not None and len(date) == 0:
+            return []
+        rows = list()
+        for i in range(0, len(tickers), MAX_PARAMETERS):
+            chunk = list(tickers[i:i + MAX_PARAMETERS])
+            sql = f'SELECT date, Close, ticker FROM "{index_name}" WHERE ticker IN ({", ".join("?" * len(chunk))})'
+            parameters = chunk
+            if date is not None:
+                sql += ' AND date BETWEEN ? AND ?'
+                parameters += [int(min(date)), int(max(date))]
+            if after is not None:
+                sql += ' AND date > ?'
+                parameters += [int(after)]
+            try:
+                with self._lock:
+                    rows += self.connection.execute(sql + ' ORDER BY ticker, date', parameters).fetchall()
+            except sqlite3.OperationalError as err:  # the table does not exist.
+                self.logger.error(err)
+                return None
+        return [{'date': d, 'Close': c, 'ticker': t} for d, c, t in rows]
+
+    def write(self, index_name: AnyStr, df: pd.DataFrame, **kwargs) -> bool:
+        """
+        Writes a standard DF with Close, ticker columns indexed on date. Rows already stored for the same ticker and
+        date are replaced, so writing the same data twice does not lead to duplicates. Options of the ES backend
+        (DB.write) are ignored.
+
+        Returns:
+            True when all rows were written.
+        """
+        if not {df.index.name, *df.columns} == {'date', 'Close', 'ticker'}:
+            self.logger.error('Required columns are not present.')
+            return False
+        self.setup_es_index(index_name=index_name)
+        self.cache_written(index_name, df)
+        df = df.loc[df['Close'].notna()]
+        rows = zip(df['ticker'].astype(str), df.index.astype('int64').tolist(), df['Close'].astype(float).tolist())
+        try:
+            with self._lock, self.connection:
+                self.connection.executemany(f'INSERT OR REPLACE INTO "{index_name}" (ticker, date, Close) '
+                                            f'VALUES (?, ?, ?)', rows)
+        except sqlite3.Error as err:
+            self.logger.error(f"Writing to {index_name} failed: {err}")
+            return False
+        self.logger.info(f"Wrote {df.shape[0]} rows to {index_name}.")
+        return True
+
+    def delete_ticker(self, ticker: AnyStr, index: AnyStr = 'time-series'):
+        self.setup_es_index(index)
+        with self._lock, self.connection:
+            self.connection.execute(f'DELETE FROM "{index}" WHERE ticker = ?', (ticker,))
+        if self.disk_cache is not None:
+            self.disk_cache.invalidate(index, ticker)
+        if self.memory_cache is not None:
+            self.memory_cache.invalidate((index, ticker))
+
+    def list_tickers(self, index_name: AnyStr = 'time-series') -> List[AnyStr]:
+        self.setup_es_index(index_name)
+        with self._lock:
+            rows = self.connection.execute(f'SELECT DISTINCT ticker FROM "{index_name}" ORDER BY ticker').fetchall()
+        return [row[0] for row in rows]
+
+    def last_dates(self, index_name: AnyStr = 'time-series',
+                   tickers: Optional[List[AnyStr]] = None) -> Dict[AnyStr, int]:
+        """Last stored date of each ticker, read from the primary key, see BaseDB.last_dates."""
+        self.setup_es_index(index_name)
+        with self._lock:
+            rows = self.connection.execute(f'SELECT ticker, MAX(date) FROM "{index_name}" '
+                                           f'GROUP BY ticker').fetchall()
+        wanted = None if tickers is None else set(tickers)
+        return {t: d for t, d in rows if wanted is None or t in wanted}
@@ -1,12 +1,27 @@
-from typing import Sequence
+from typing import Sequence, Optional
 from portfolio.Position import Position
-from portfolio.Database import DB
+from portfolio.Database import get_db
 from portfolio import utils
 import pandas as pd
 import numpy as np
-import datetime
+from collections import deque
+import functools
+import bisect
 
-db = DB()
+db = get_db()
+
+
+def memoized_property(method):
+    """
+    Property computed once per replay of the positions, the values are cached until Ticker.update() clears them.
+    Cached series are shared, use .rename() rather than assigning their name.
+    """
+    @functools.wraps(method)
+    def getter(self):
+        if method.__name__ not in self._cache:
+            self._cache[method.__name__] = method(self)
+        return self._cache[method.__name__]
+    return property(getter)
 
 
 class Ticker:
@@ -16,9 +31,10 @@ class Ticker:
     """
     logger = utils.get_logger(__name__)
 
-    def __init__(self, positions: Sequence[Position], value=None, clean_weekends=True, today=None):
+    def __init__(self, positions: Sequence[Position], value=None, clean_weekends=True, today=None,
+                 prices: Optional[pd.Series] = None):
         """
-        mat_* are matrices organized as (time, n_shares)
+        mat_* are matrices organized as (time, lots), built on demand from the lots.
         tc_* are column vectors representing time-courses.
         current_* are scalars or row vectors representing the most recent value.
 
@@ -27,9 +43,14 @@ class Ticker:
             value: Use this for testing purposes to overwrite the mat_value ticker mat_value.
             clean_weekends: Boolean to filter out weekend days from the time line.
             today: Should the time_line be built using all the time points until today.
+            prices: Series of ticker values indexed on date, e.g. a column of DB.read_many. When given the DB is not
+            queried.
         """
         self.today = utils.today() if today is None else today
         self.clean_weekends = clean_weekends
+        self._time_line = (None, None)  # (key, time line)
+        self._cache = dict()
+        self.version = 0  # incremented whenever the lots or the time line change.
         # Sort positions
         dates = [p.date for p in positions]
         positions = [positions[i] for i in np.argsort(dates)]
@@ -49,7 +70,11 @@ class Ticker:
             raise Exception("No positions are given...")
 
         # Get the value or use the passed one.
-        self.tc_ticker_value = db.read(self.ticker, self.time_line, output_format='series')
+        if prices is not None:
+            self.tc_ticker_value = prices.reindex(self.time_line)
+            self.tc_ticker_value.index.name = 'date'
+        else:
+            self.tc_ticker_value = db.read(self.ticker, self.time_line, output_format='series')
 
         if value is not None:  # use the passed value
             value = utils.ensure_iterable(value)
@@ -66,16 +91,6 @@ class Ticker:
         if self.tc_ticker_value.isna().all():
             raise Exception(f"There is a column full of nans for ticker {self.ticker}")
 
-        # Prepare the data storing variables
-        self.lots = list()
-        self.mat_quantity = pd.DataFrame(index=pd.Index(self.time_line, name='date'))
-        self.mat_value = pd.DataFrame(index=pd.Index(self.time_line, name='date'))
-        self.mat_investment = pd.DataFrame(index=pd.Index(self.time_line, name='date'))
-        self.mat_profit_loss = pd.DataFrame(index=pd.Index(self.time_line, name='date'))
-        # counter_* are incremented when shares are bought or sold. Their difference is the number of open shares.
-        self.tc_counter_buy = pd.Series(data=0, index=pd.Index(self.time_line, name='date'), name='buy_counter')
-        self.tc_counter_sell = pd.Series(data=0, index=pd.Index(self.time_line, name='date'), name='sell_counter')
-
         self.update()
 
         #  TODO: Raise an exception when a column is just NaN.
@@ -84,200 +99,410 @@ class Ticker:
         return ''.join([f"Pos#{i}: {pos.__str__()}\n" for i, pos in enumerate(self.positions)])
 
     def update(self):
+        """
+        Replays the positions. Sells are matched against the open lots in a single pass, which gives a table of lots
+        and of their closings. Time courses are cumulative sums of these events over the time line joined to the
+        ticker values, so that memory scales with days plus lots. The mat_* matrices are only built on demand.
+        """
+        self._cache = dict()
+        self.version += 1
+        self._dates = np.asarray(self.time_line, dtype=int)
+        self.lots = list()
+        # lots: first row, number of shares and unit cost.
+        self._first_rows = list()
+        self._quantities = list()
+        self._costs = list()
+        # open lots in the order they were bought, with the number of shares they still hold.
+        self._queue = deque()
+        self._held = list()
+        # closings of the lots: (lot, row, sold shares, shares left, sell).
+        self._closings = list()
+        # sells: (row, number of shares, number of lots bought before the sell).
+        self._sells = list()
+        # number of shares ever bought and sold, in the order of the positions.
+        self._bought = 0
+        self._sold = 0
+        # time courses: shares bought and sold until each day, number of open lots with shares and invested money.
+        self._counter_buy, self._counter_sell, self._open_lots, self._invested = (
+            np.zeros(len(self._dates)) for _ in range(4))
 
         for pos in self.positions:
-            if pos.action == "buy":
-                self.logger.info('Buying positions')
-                self.add_lot(pos)
-            elif pos.action == "sell":
-                self.logger.info('Selling positions.')
-                self.close_position(pos)
+            self.replay(pos)
+        self.tally()
+
+    def replay(self, pos: Position):
+        if pos.action == "buy":
+            self.logger.info('Buying positions')
+            self.add_lot(pos)
+        elif pos.action == "sell":
+            self.logger.info('Selling positions.')
+            self.close_position(pos)
+
+    def add_position(self, pos: Position):
+        """
+        Adds a position without rebuilding the ticker. A position dated on or after the last one is replayed on top of
+        the open lots and only its events are added to the time courses. An earlier position changes which lots the
+        later sells close, all positions are replayed then.
+        """
+        if pos.ticker != self.ticker:
+            raise Exception("There are different tickers in the positions list...")
+        self.row(pos.date)  # the date must be on the time line.
+        if pos.date >= self.positions[-1].date:
+            counts = len(self.lots), len(self._closings), len(self._sells)
+            self.replay(pos)
+            self.positions.append(pos)
+            self._cache = dict()
+            self.version += 1
+            self.tally(*counts)
+        else:
+            positions = self.positions
+            at = bisect.bisect_right([p.date for p in positions], pos.date)
+            self.positions = positions[:at] + [pos] + positions[at:]
+            try:
+                self.update()
+            except Exception:
+                self.positions = positions
+                self.update()
+                raise
+
+    def append_prices(self, dates, closes):
+        """
+        Extends the time line until the last of DATES with the new values of the ticker, days without a value are NaN.
+        Lots are untouched, their time courses are carried over the new days.
+        Args:
+            dates: Dates after the end of the time line.
+            closes: Value of the ticker at these dates.
+        """
+        dates = np.atleast_1d(np.asarray(dates, dtype=int))
+        if len(dates) == 0:
+            return
+        if dates.min() <= self._dates[-1]:
+            raise ValueError(f"Values of {self.ticker} can only be appended after {self._dates[-1]}.")
+        days = self.make_time_line(self._dates[-1] + 60 * 60 * 24, dates.max(), self.clean_weekends)
+        values = pd.Series(np.atleast_1d(np.asarray(closes, dtype=float)), index=dates).reindex(days)
+        self.tc_ticker_value = pd.concat([self.tc_ticker_value, values])
+        self.tc_ticker_value.index.name = 'date'
+
+        self.today = int(dates.max())
+        self._dates = np.concatenate([self._dates, days])
+        self._time_line = ((self.positions[0].date, self.today, self.clean_weekends), self._dates)
+        self._counter_buy, self._counter_sell, self._open_lots, self._invested = (
+            np.concatenate([tc, np.full(len(days), tc[-1])]) for tc in
+            (self._counter_buy, self._counter_sell, self._open_lots, self._invested))
+        self._cache = dict()
+        self.version += 1
 
     def add_lot(self, pos: Position):
         """
-        Updates mat_* matrices by adding new columns from the right side for each share.
+        Opens a new lot, at the end of the FIFO queue.
         """
-
         self.lots.append(len(self.lots))
         current_lot = self.lots[-1]
         self.logger.info(f'Adding share {current_lot}.')
 
-        # fill up mat_investment
-        self.mat_investment[current_lot] = pos.cost
-        invalid = self.mat_investment.index < pos.date  # invalid indices are prior to position opening.
-        self.mat_investment.loc[invalid, current_lot] = np.nan
-
-        # fill up mat_quantity
-        self.mat_quantity[current_lot] = pos.quantity
-        self.mat_quantity.loc[invalid, current_lot] = np.nan
-
-        # fill up price
-        self.mat_value[current_lot] = self.tc_ticker_value
-        self.mat_value.loc[invalid, current_lot] = np.nan
-
-        # fill up mat_profit_loss
-        self.mat_profit_loss[current_lot] = 0
-        self.mat_profit_loss.loc[invalid, current_lot] = np.nan
+        self._first_rows.append(int(np.searchsorted(self._dates, pos.date)))  # first row after position opening.
+        self._quantities.append(pos.quantity)
+        self._costs.append(pos.cost)
+        self._held.append(pos.quantity)
+        self._queue.append(current_lot)
 
         # increment the share counter
-        self.tc_counter_buy.loc[~invalid] += pos.quantity
-        # incremented by 1.
+        self._bought += pos.quantity
 
     def close_position(self, pos: Position):
         """
-        Updates 3 dataframes: mat_investment, profit_lost, mat_value.
-        Implements FIFO logic for selling shares ie sells shares that were bought first. For all sold shares,
-        time-series are NaNized for all time-points coming after the sell transaction.
-
+        Implements FIFO logic for selling shares ie sells shares that were bought first. Each lot the shares are sold
+        from gets a closing. A lot is closed when it holds no shares anymore.
         """
-        if self.tc_open_shares.loc[pos.date] < abs(pos.quantity):
+        row = self.row(pos.date)
+        if self._bought - self._sold < abs(pos.quantity):
             raise ValueError(f'You do not have enough shares to sell {pos.quantity} at time {pos.date}.')
 
-        to_be_sold = self.fifo(pos.quantity, pos.date)
-        self.mat_quantity -= to_be_sold
-
-        self.logger.info('Profit/Loss will be updated following this transaction')
-        self.mat_profit_loss += to_be_sold * (self.mat_value - self.mat_investment)
-
-        # self.logger.info(f'All time points bigger than {pos.date} will be nanized for share {current_share}.')
-        self.mat_investment[self.mat_quantity == 0] = np.nan
-        self.mat_value[self.mat_quantity == 0] = np.nan
+        for lot, (sold, left) in self.fifo(pos.quantity).items():
+            self._held[lot] = left
+            self._closings.append((lot, row, sold, left, len(self._sells)))
+        self._sells.append((row, abs(pos.quantity), len(self.lots)))
 
         # decrement the share counter
-        self.tc_counter_sell -= pos.quantity  # pos.quantity is a negative number, counter is positive.
+        self._sold -= pos.quantity  # pos.quantity is a negative number, counter is positive.
 
-    def fifo(self, to_sell, date):
+    def fifo(self, to_sell):
         """
-        Implements the FIFO logic for deciding which shares to sell.
+        Implements the FIFO logic for deciding which shares to sell. Lots are taken from the head of the queue of open
+        lots and leave it once empty, so that each lot is visited once over all sells.
         Args:
-            to_sell:
-            date:
+            to_sell: Number of shares to sell.
 
         Returns:
-
+            (sold shares, shares left) of each lot sold from, keyed by lot.
         """
-        def _fifo():
-            nonlocal sold
-            nonlocal col
-            nonlocal iter_count
-            while sold < to_sell:
-                iter_count += 1
-                if (df.iloc[valid, col] == 0).all():  # if there are no shares to sell
-                    col = col + 1
-                    _fifo()
-                else:
-                    decrement = np.min([df.iloc[valid, col].min(), to_sell-sold])
-                    df.iloc[valid, col] = df.iloc[valid, col] - decrement
-                    sold = sold + decrement
-                if iter_count == 100:
-                    import pdb
-                    a=1
-        iter_count = 0
         to_sell = np.abs(to_sell)
-        df = self.mat_quantity.copy()
-        # df = self.mat_quantity.copy()
-        valid = df.index >= date
+        left = dict()
         sold = 0
-        col = 0
-        _fifo()
-        return self.mat_quantity - df
+        while sold < to_sell:
+            lot = self._queue[0]
+            remaining = left.get(lot, self._held[lot])
+            if remaining == 0:  # if there are no shares to sell
+                self._queue.popleft()
+            else:
+                decrement = np.min([remaining, to_sell - sold])
+                left[lot] = remaining - decrement
+                sold = sold + decrement
+        return {lot: (self._held[lot] - remaining, remaining) for lot, remaining in left.items()}
+
+    def _events(self, lots: int = 0, closings: int = 0):
+        """Lots and closings as arrays, from the LOTS-th lot and the CLOSINGS-th closing on."""
+        lots = (np.asarray(self._first_rows[lots:], dtype=int), np.asarray(self._quantities[lots:], dtype=float),
+                np.asarray(self._costs[lots:], dtype=float))
+        closings = np.asarray(self._closings[closings:], dtype=float).reshape(-1, 5).T
+        return lots, (closings[0].astype(int), closings[1].astype(int), closings[2], closings[3],
+                      closings[4].astype(int))
+
+    def _cumulate(self, rows: np.ndarray, weights) -> np.ndarray:
+        """Cumulative sum over the time line of WEIGHTS occurring at ROWS."""
+        weights = np.broadcast_to(np.asarray(weights, dtype=float), rows.shape)
+        return np.cumsum(np.bincount(rows, weights=weights, minlength=len(self._dates)))
+
+    def tally(self, lots: int = 0, closings: int = 0, sells: int = 0):
+        """
+        Adds the events from the LOTS-th lot, the CLOSINGS-th closing and the SELLS-th sell on to the time courses: the
+        shares bought and sold until each day, the number of open lots with shares and the invested money.
+        """
+        (first, quantities, _), (lot, row, sold, left, _) = self._events(lots, closings)
+        costs = np.asarray(self._costs, dtype=float)
+        sells = np.asarray(self._sells[sells:], dtype=float).reshape(-1, 3).T
+
+        self._counter_buy += self._cumulate(first, quantities)
+        self._counter_sell += self._cumulate(sells[0].astype(int), sells[1])
+        self._open_lots += self._cumulate(first[quantities != 0], 1) - self._cumulate(row[left == 0], 1)
+        self._invested += self._cumulate(np.concatenate([first, row]),
+                                         np.concatenate([quantities * costs[lots:], -sold * costs[lot]]))
+        self._invested[self._open_lots == 0] = 0  # no rounding residue once all lots are closed.
+
+    def _closes(self):
+        """
+        Row from which each lot is closed (the length of the time line while open) and the sell that closes it (-1
+        while open). A lot is closed by the sell that leaves no shares in it. A lot bought without shares is closed
+        from its opening on, by the first sell after it.
+        """
+        (first, quantities, _), (lot, row, _, left, sell) = self._events()
+        close = np.full(len(first), len(self._dates))
+        closer = np.full(len(first), -1)
+        zero = np.flatnonzero(quantities == 0)
+        after = np.searchsorted(self._lots_at_sells(), zero, side='right')
+        zero, after = zero[after < len(self._sells)], after[after < len(self._sells)]
+        close[zero], closer[zero] = first[zero], after
+        close[lot[left == 0]], closer[lot[left == 0]] = row[left == 0], sell[left == 0]
+        return close, closer
+
+    def _lots_at_sells(self) -> np.ndarray:
+        """Number of lots bought before each sell."""
+        return np.asarray(self._sells, dtype=float).reshape(-1, 3)[:, 2].astype(int)
+
+    def _profit_loss_ends(self):
+        """
+        Mask of the lots that had shares sold after them (their profit/loss follows the value of the ticker) and row
+        from which their profit/loss is NaN: once a lot is closed, the sells after its closing leave it NaN.
+        """
+        close, closer = self._closes()
+        lots_at_sells = self._lots_at_sells()
+        sold = np.arange(len(close)) < (lots_at_sells[-1] if len(lots_at_sells) else 0)
+        return sold, np.where((closer >= 0) & (closer < len(self._sells) - 1), close, len(self._dates))
+
+    def _mat_open(self) -> np.ndarray:
+        """
+        Mask of the lots that are open, from their opening until they are closed.
+        """
+        first = np.asarray(self._first_rows, dtype=int)
+        rows = np.arange(len(self._dates))[:, None]
+        return (rows >= first[None, :]) & (rows < self._closes()[0][None, :])
+
+    def _mat_quantity(self) -> np.ndarray:
+        (first, quantities, _), (lot, row, _, left, _) = self._events()
+        valid = np.arange(len(self._dates))[:, None] >= first[None, :]  # invalid indices are prior to opening.
+        quantity = np.where(valid, quantities, np.nan)
+        for lot_, row_, left_ in zip(lot, row, left):
+            quantity[row_:, lot_] = left_
+        return quantity
+
+    @property
+    def lot_table(self) -> pd.DataFrame:
+        """
+        One row per lot with its opening and closing dates (NaN while open), number of shares bought and unit cost.
+        """
+        (first, quantities, costs), _ = self._events()
+        close = self._closes()[0]
+        close_date = np.full(len(first), np.nan)
+        close_date[close < len(self._dates)] = self._dates[close[close < len(self._dates)]]
+        return pd.DataFrame({'open_date': self._dates[first], 'close_date': close_date, 'quantity': quantities,
+                             'cost': costs}, index=pd.Index(self.lots, name='lot'))
+
+    @property
+    def closings(self) -> pd.DataFrame:
+        """
+        Shares sold from each lot: one row per lot and sell with the date, the number of sold shares and the number
+        of shares left in the lot.
+        """
+        return pd.DataFrame([(lot, self._dates[row], sold, left) for lot, row, sold, left, _ in self._closings],
+                            columns=['lot', 'date', 'quantity', 'left'])
+
+    def row(self, date) -> int:
+        """Index of DATE in the time line."""
+        row = int(np.searchsorted(self._dates, date))
+        if row == len(self._dates) or self._dates[row] != date:
+            raise KeyError(date)
+        return row
 
     @property
     def time_line(self):
         """
         Computes the time index for all dataframes.
         It excludes weekends. It starts from the first date a position is open and stops at self.today.
+        The time line is computed again only when one of these changes.
+        """
+        start = self.positions[0].date if len(self.positions) != 0 else None  # positions are sorted by date.
+        key = (start, self.today, self.clean_weekends)
+        if self._time_line[0] != key:
+            self._time_line = (key, self.make_time_line(start, self.today, self.clean_weekends))
+        return self._time_line[1]
+
+    @staticmethod
+    def make_time_line(start, today, clean_weekends=True):
+        """
+        Daily time points from START until TODAY (both included), optionally excluding weekends.
         """
         step_size = (60 * 60 * 24)
-        dummy = np.arange(min([pos.date for pos in self.positions]),
-                          self.today + step_size,  # if step_size not added it will exclude
+        dummy = np.arange(start,
+                          today + step_size,  # if step_size not added it will exclude
                           # today
                           step_size,
-                          dtype=int) if len(self.positions) != 0 else []
-        # exclude weekends
-        weekends = [datetime.datetime.fromtimestamp(ts).weekday() <= 4 for ts in dummy]
-        # self.logger.info(f"Will remove {np.sum(weekends)} weekend days from the time line")
-        return dummy[weekends] if self.clean_weekends else dummy
+                          dtype=int) if start is not None else np.array([], dtype=int)
+        # exclude weekends, dates are midnight UTC and 1970-01-01 was a Thursday (Monday is 0).
+        weekdays = (dummy // step_size + 3) % 7 <= 4
+        return dummy[weekdays] if clean_weekends else dummy
 
     # ######################################################
-    # Parameters directly coming from the mat_* dataframes.
-    # Time-Courses (TC).
+    # mat_* matrices organized as (time, lots), built on demand from the lots and their closings.
+
+    def _matrix(self, values: np.ndarray) -> pd.DataFrame:
+        return pd.DataFrame(values, index=pd.Index(self._dates, name='date'), columns=self.lots)
 
     @property
-    def tc_invested(self):
-        # total money that has been invested.
-        s = (self.mat_investment * self.mat_quantity).sum(axis=1)
-        s.name = 'tc_invested'
-        return s
+    def mat_quantity(self):
+        return self._matrix(self._mat_quantity())
 
     @property
-    def tc_cost(self):
-        # synonym of invested
-        s = self.tc_invested
-        s.name = 'tc_cost'
-        return s
+    def mat_investment(self):
+        return self._matrix(np.where(self._mat_open(), np.asarray(self._costs, dtype=float), np.nan))
 
     @property
-    def tc_profit_loss(self):
-        s = self.mat_profit_loss.sum(axis=1, skipna=True, min_count=1)
-        s.name = 'tc_profit_loss'
-        return s
+    def mat_value(self):
+        return self._matrix(np.where(self._mat_open(), self.tc_ticker_value.values.astype(float)[:, None], np.nan))
 
     @property
+    def mat_profit_loss(self):
+        (first, _, costs), (lot, row, sold, _, _) = self._events()
+        value = self.tc_ticker_value.values.astype(float)
+        rows = np.arange(len(self._dates))[:, None]
+        profit_loss = np.where(rows >= first[None, :], 0., np.nan)
+        for lot_, row_, sold_ in zip(lot, row, sold):
+            profit_loss[row_:, lot_] += sold_ * (value[row_:] - costs[lot_])
+        sold, end = self._profit_loss_ends()
+        profit_loss[(np.isnan(value)[:, None] & sold[None, :]) | (rows >= end[None, :])] = np.nan
+        return self._matrix(profit_loss)
+
+    # ######################################################
+    # Parameters directly coming from the lots.
+    # Time-Courses (TC).
+
+    def _series(self, values: np.ndarray, name: str) -> pd.Series:
+        return pd.Series(values.copy(), index=pd.Index(self._dates, name='date'), name=name)
+
+    @memoized_property
+    def tc_counter_buy(self):
+        return self._series(self._counter_buy, 'buy_counter')
+
+    @memoized_property
+    def tc_counter_sell(self):
+        # all the sells are counted from the start of the time line.
+        return self._series(np.full(len(self._dates), float(self._sold)), 'sell_counter')
+
+    @memoized_property
+    def tc_invested(self):
+        # total money that has been invested in the open shares.
+        return self._series(self._invested, 'tc_invested')
+
+    @memoized_property
+    def tc_cost(self):
+        # synonym of invested
+        return self.tc_invested.rename('tc_cost')
+
+    @memoized_property
+    def tc_profit_loss(self):
+        # profit/loss of the sold shares at the current value of the ticker, the sum of the columns of mat_profit_loss.
+        (first, _, costs), (lot, row, sold, _, _) = self._events()
+        value = self.tc_ticker_value.values.astype(float)
+        lots_sold, end = self._profit_loss_ends()
+        # sold shares and their cost count from the sell until the profit/loss of their lot is NaN.
+        counted = row < end[lot]
+        row, stop, sold, cost = row[counted], end[lot][counted], sold[counted], (sold * costs[lot])[counted]
+        stops = stop < len(self._dates)
+        shares = self._cumulate(row, sold) - self._cumulate(stop[stops], sold[stops])
+        cost = self._cumulate(row, cost) - self._cumulate(stop[stops], cost[stops])
+        # lots with a profit/loss, those with sells after them have none on days without a value of the ticker.
+        stop = end[lots_sold]
+        lots = self._cumulate(first[lots_sold], 1) - self._cumulate(stop[stop < len(self._dates)], 1)
+        lots = self._cumulate(first[~lots_sold], 1) + np.where(np.isnan(value), 0, lots)
+        profit_loss = np.where(np.isnan(value), 0., value * shares - cost)
+        return self._series(np.where(lots > 0, profit_loss, np.nan), 'tc_profit_loss')
+
+    @memoized_property
     def tc_value(self):
-        # portfolio value
-        s = (self.mat_value * self.mat_quantity).sum(axis=1, skipna=True, min_count=1)
-        s.name = 'tc_value'
-        return s
+        # portfolio value, NaN when no lot is open.
+        close = self._closes()[0]
+        lots = self._cumulate(np.asarray(self._first_rows, dtype=int), 1) - self._cumulate(
+            close[close < len(self._dates)], 1)
+        # shares held on each day, no rounding residue once all lots are closed.
+        shares = np.where(self._open_lots > 0, self._counter_buy - self._counter_sell, 0)
+        return self._series(np.where(lots > 0, self.tc_ticker_value.values * shares, np.nan), 'tc_value')
 
     # ######################################################
     # Derivative Parameters
 
-    @property
+    @memoized_property
     def tc_unrealized_gain(self):
-        s = (self.mat_quantity*(self.mat_value - self.mat_investment)).sum(axis=1, skipna=True, min_count=1)
-        s.name = 'tc_unrealized_gain'
-        return s
+        gain = self.tc_value.values - self._invested
+        return self._series(gain, 'tc_unrealized_gain')
 
-    @property
+    @memoized_property
     def tc_returns(self):
-        s = 100 * self.tc_unrealized_gain / self.tc_cost
-        s.name = 'tc_returns'
-        return s
+        return (100 * self.tc_unrealized_gain / self.tc_cost).rename('tc_returns')
 
-    @property
+    @memoized_property
     def tc_average_cost_per_share(self):
-        s = self.tc_invested / self.tc_open_shares
-        s.name = 'tc_average_cost_per_share'
-        return s
+        return (self.tc_invested / self.tc_open_shares).rename('tc_average_cost_per_share')
 
     # ######################################################
     # Share counts:
 
-    @property
+    @memoized_property
     def tc_total_shares(self):
         # total number of shares that were ever transacted (buys + sells together)
-        s = self.tc_counter_buy
-        s.name = 'tc_total_shares'
-        return s
+        return self.tc_counter_buy.rename('tc_total_shares')
 
-    @property
+    @memoized_property
     def tc_open_shares(self):
         # number of shares that are currently open
-        s = self.tc_counter_buy - self.tc_counter_sell
-        s.name = 'tc_open_shares'
-        return s
+        return (self.tc_counter_buy - self.tc_counter_sell).rename('tc_open_shares')
 
-    @property
+    @memoized_property
     def tc_closed_shares(self):
         # number of shares that were sold
-        s = self.tc_counter_sell
-        s.name = 'tc_closed_shares'
-        return s
+        return self.tc_counter_sell.rename('tc_closed_shares')
 
     # ######################################################
     # Same as above but extract the CURRENT_VALUE ie take only the last value, this could be automatized at class level.
-    # Get the last element of all tc_* properties.
+    # Get the last element of all tc_* properties, which are computed once.
 
     @property
     def current_value(self):
@@ -0,0 +1,61 @@
+"""Index templates applied to the ES indices created by the DB."""
+
+# one document per ticker and day. Sorting the index on (ticker, date) keeps the documents of a ticker next to each
+# other on disk, in date order.
+time_series = {
+    "index_patterns": ["time-series"],
+    "template": {
+        "settings": {
+            "number_of_shards": 1,
+            "number_of_replicas": 1,
+            "index": {
+                "sort.field": ["ticker", "date"],
+                "sort.order": ["asc", "asc"],
+            },
+        },
+        "mappings": {
+            "dynamic": "strict",
+            "properties": {
+                "ticker": {"type": "keyword"},
+                "date": {"type": "date", "format": "epoch_second"},
+                "Close": {"type": "double"},
+            },
+        },
+    },
+}
+
+
+def bucketed(index_name: str) -> dict:
+    """
+    Template of a bucketed index, where one document holds the closes of a ticker for a whole bucket (year or month)
+    as parallel date and Close arrays. Buckets are found with their first and last dates, the arrays are not indexed.
+    """
+    return {
+        "index_patterns": [index_name],
+        "template": {
+            "settings": {
+                "number_of_shards": 1,
+                "number_of_replicas": 1,
+                "index": {
+                    "sort.field": ["ticker", "first_date"],
+                    "sort.order": ["asc", "asc"],
+                },
+            },
+            "mappings": {
+                "dynamic": "strict",
+                "properties": {
+                    "ticker": {"type": "keyword"},
+                    "bucket": {"type": "keyword"},
+                    "first_date": {"type": "date", "format": "epoch_second"},
+                    "last_date": {"type": "date", "format": "epoch_second"},
+                    "date": {"type": "long", "index": False, "doc_values": False},
+                    "Close": {"type": "double", "index": False, "doc_values": False},
+                },
+            },
+        },
+    }
+
+
+templates = {'time-series': time_series,
+             'time-series-yearly': bucketed('time-series-yearly'),
+             'time-series-monthly': bucketed('time-series-monthly')}
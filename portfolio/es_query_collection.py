@@ -1,18 +1,58 @@
 from typing import AnyStr, List
 from elasticsearch_dsl import Q
 
+# above this many requested dates a terms filter is replaced by the min/max range they span.
+MAX_TERMS = 1024
 
-def matcher(ticker: AnyStr):
+
+def matcher(ticker: AnyStr, field: AnyStr = 'ticker'):
+    """
+    Basic query to fetch all matching tickers. FIELD is the keyword field of the ticker, `ticker.keyword` for indices
+    created with dynamic mapping.
+    """
+    return Q('term', **{field: ticker})
+
+
+def matcher_many(tickers: List, field: AnyStr = 'ticker'):
+    """
+    Fetches all documents of any of the given tickers.
+    """
+    return Q('terms', **{field: list(tickers)})
+
+
+def time_filter(dates: List, max_terms: int = MAX_TERMS):
+    """
+    Restricts a query to the requested time points. Short lists of dates are sent as a terms filter, long ones (e.g.
+    a Ticker time line) as the range they span; the caller aligns the hits on the requested dates afterwards.
+    Args:
+        dates: a list of epoch seconds.
+        max_terms: maximum number of dates sent as individual terms.
+    """
+    dates = [int(d) for d in dates]
+    if len(dates) <= max_terms:
+        return Q('terms', date=dates)
+    return Q('range', date={'gte': min(dates), 'lte': max(dates)})
+
+
+def after_filter(date: int):
+    """
+    Restricts a query to the time points strictly after DATE (epoch seconds).
+    """
+    return Q('range', date={'gt': int(date)})
+
+
+def bucket_filter(dates: List):
     """
-    Basic query to fetch all matching tickers.
+    Restricts a query on a bucketed index to the buckets overlapping with the requested time points.
     """
-    return Q('term', ticker__keyword=ticker)
+    dates = [int(d) for d in dates]
+    if not dates:
+        return Q('terms', first_date=[])  # matches nothing
+    return Q('range', last_date={'gte': min(dates)}) & Q('range', first_date={'lte': max(dates)})
 
 
-def time_filter(ticker: List, dates: List):
+def bucket_after_filter(date: int):
     """
-    Returns ticker values at specific dates.
+    Restricts a query on a bucketed index to the buckets containing time points strictly after DATE.
     """
-    return {"query": {"bool": {"must": [{"terms": {"ticker": ['MA']}},
-                                        {"terms": {"date": [1579478400, 1579564800, 1579651200, 1579737600]}}]}}}
-# Q('bool', must=[Q('terms', date=['1579564800','1579651200']), Q('terms', **{'ticker.keyword':['MA','GOOG']})])
\ No newline at end of file
+    return Q('range', last_date={'gt': int(date)})
@@ -0,0 +1,62 @@
+import pandas as pd
+import pytest
+import elasticsearch
+import elasticsearch.helpers
+from portfolio.Database import DB
+from portfolio import AsyncDatabase
+
+pytest.importorskip('aiohttp')
+
+# documents of the fake cluster, per ticker.
+stored = {'AAPL': [{'date': 10, 'Close': 1., 'ticker': 'AAPL'}, {'date': 20, 'Close': 2., 'ticker': 'AAPL'}],
+          'MSFT': [{'date': 10, 'Close': 5., 'ticker': 'MSFT'}],
+          'DUPL': [{'date': 10, 'Close': 1., 'ticker': 'DUPL'}, {'date': 10, 'Close': 1., 'ticker': 'DUPL'}]}
+
+
+class FakeAsyncClient:
+    """Stands in for AsyncElasticsearch, records the scrolled tickers."""
+    instances = list()
+
+    def __init__(self, host, maxsize):
+        self.scanned = list()
+        self.closed = False
+        FakeAsyncClient.instances.append(self)
+
+    async def close(self):
+        self.closed = True
+
+
+async def fake_async_scan(client, query, index):
+    # the requested dates are not filtered, reads align the rows on them.
+    matcher = query['query']['bool']['must'][0] if 'bool' in query['query'] else query['query']
+    ticker, = matcher['terms']['ticker']
+    client.scanned.append(ticker)
+    for doc in stored.get(ticker, []):
+        yield {'_source': doc}
+
+
+@pytest.fixture
+def db(monkeypatch):
+    db_ = DB(cache_dir='', memory_cache_size=0)
+    db_.online, db_.checked_at = True, float('inf')  # the health state is trusted.
+    db_.ready_indices.add('time-series')
+    db_.ticker_fields['time-series'] = 'ticker'
+    monkeypatch.setattr(elasticsearch, 'AsyncElasticsearch', FakeAsyncClient, raising=False)
+    monkeypatch.setattr(elasticsearch.helpers, 'async_scan', fake_async_scan, raising=False)
+    FakeAsyncClient.instances.clear()
+    return db_
+
+
+def test_read_many_reads_each_ticker_with_the_async_client(db):
+    out = AsyncDatabase.read_many(['AAPL', 'MSFT'], [10, 20], db=db)
+    client, = FakeAsyncClient.instances
+    assert sorted(client.scanned) == ['AAPL', 'MSFT'] and client.closed
+    pd.testing.assert_series_equal(out['AAPL'], pd.Series([1., 2.], index=pd.Index([10, 20], name='date')),
+                                   check_names=False)
+    # missing days are forward-filled like in DB.read.
+    assert out['MSFT'].tolist() == [5., 5.]
+
+
+def test_read_es_detects_duplicates(db):
+    with pytest.raises(Exception, match='duplicated'):
+        AsyncDatabase.read_many(['DUPL'], [10], db=db)
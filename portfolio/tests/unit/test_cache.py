@@ -0,0 +1,51 @@
+import pandas as pd
+from portfolio.Cache import DiskCache, LRUCache
+import time
+
+index_name = 'time-series'
+
+
+def test_round_trip(tmp_path):
+    cache = DiskCache(str(tmp_path))
+    s = pd.Series([1., 2., 3.], index=pd.Index([10, 20, 30], name='date'), name='AAPL')
+    assert cache.append(index_name, s) == 3
+    assert cache.read(index_name, 'AAPL').equals(s)
+    assert cache.watermark(index_name, 'AAPL') == 30
+
+
+def test_append_only_after_watermark(tmp_path):
+    cache = DiskCache(str(tmp_path))
+    cache.append(index_name, pd.Series([1., 2.], index=pd.Index([10, 20], name='date'), name='AAPL'))
+    # the first two dates are already cached and must not overwrite the cached values.
+    s = pd.Series([9., 9., 3.], index=pd.Index([10, 20, 30], name='date'), name='AAPL')
+    assert cache.append(index_name, s) == 1
+    assert cache.read(index_name, 'AAPL').tolist() == [1., 2., 3.]
+
+
+def test_missing_and_invalidated_ticker(tmp_path):
+    cache = DiskCache(str(tmp_path))
+    assert cache.read(index_name, 'AAPL') is None
+    assert cache.watermark(index_name, 'AAPL') is None
+    cache.append(index_name, pd.Series([1.], index=pd.Index([10], name='date'), name='AAPL'))
+    cache.invalidate(index_name, 'AAPL')
+    assert not cache.has(index_name, 'AAPL')
+
+
+def test_lru_eviction_and_stats():
+    cache = LRUCache(maxsize=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1  # 'b' is now the least recently used entry.
+    cache.put('c', 3)
+    assert cache.get('b') is None
+    assert cache.stats == {'hits': 1, 'misses': 1, 'evictions': 1, 'size': 2}
+
+
+def test_lru_ttl_and_invalidation():
+    cache = LRUCache(maxsize=2, ttl=0.01)
+    cache.put('a', 1)
+    time.sleep(0.02)
+    assert cache.get('a') is None
+    cache.put('b', 2)
+    cache.invalidate('b')
+    assert 'b' not in cache
@@ -1,5 +1,7 @@
 import pandas as pd
+import portfolio.Database as Database
 from portfolio.Database import DB
+from portfolio.es_index_templates import templates
 import time
 import numpy as np
 from portfolio import utils
@@ -62,3 +64,192 @@ def test_equality_of_time_points():
     # Until this question is answered this test will fail, the next one is a related question.
     # also there lots of days where the data should be missing, such as holidays etc.
     assert np.all(df.index == indices)
+
+
+def test_read_many_matches_read():
+    # the panel returned for many tickers must contain the same values as the tickers read one by one.
+    start_time = 1599696000
+    indices = np.arange(start_time, start_time + 30 * (60 * 60 * 24), (60 * 60 * 24), dtype=int)
+    tickers = ['AAPL', 'MSFT']
+    panel = db.read_many(tickers, indices)
+    for ticker in tickers:
+        s = db.read(ticker, indices, output_format='series')
+        pd.testing.assert_series_equal(panel[ticker], s, check_dtype=False, check_names=False)
+
+
+class FakeIndices:
+    """Stands in for the indices API, with the mapping of the ticker field of each existing index."""
+
+    def __init__(self, ticker_mappings):
+        self.ticker_mappings = ticker_mappings
+        self.requests = 0
+
+    def get_mapping(self, index):
+        self.requests += 1
+        if index not in self.ticker_mappings:
+            raise Database.NotFoundError(404, 'index_not_found_exception', {})
+        return {index: {'mappings': {'properties': {'ticker': self.ticker_mappings[index]}}}}
+
+
+class FakeClient:
+    """Stands in for the Elasticsearch client, counts the pings."""
+
+    def __init__(self, reachable=True, ticker_mappings=None, docs=None):
+        self.reachable = reachable
+        self.pings = 0
+        self.indices = FakeIndices(ticker_mappings or {})
+        self.docs = docs or {}  # _id: _source of the stored documents.
+        self.mgets = list()
+
+    def mget(self, index, body):
+        self.mgets.append(body['ids'])
+        return {'docs': [{'_id': _id, 'found': True, '_source': self.docs[_id]} if _id in self.docs else
+                         {'_id': _id, 'found': False} for _id in body['ids']]}
+
+    def ping(self):
+        self.pings += 1
+        return self.reachable
+
+
+def test_is_online_pings_once_per_interval(monkeypatch):
+    now = [1000.]
+    monkeypatch.setattr(Database, 'time', lambda: now[0])
+    db_ = DB(cache_dir='', health_check_interval=30)
+    db_.client = FakeClient()
+    assert db_.is_online() and db_.is_online()
+    assert db_.client.pings == 1
+    now[0] += 31
+    db_.client.reachable = False
+    assert not db_.is_online()
+    assert db_.client.pings == 2
+
+
+def test_mark_offline_trips_until_next_ping(monkeypatch):
+    now = [1000.]
+    monkeypatch.setattr(Database, 'time', lambda: now[0])
+    db_ = DB(cache_dir='', health_check_interval=30)
+    db_.client = FakeClient()
+    assert db_.is_online()
+    db_.mark_offline(Database.ESConnectionError('N/A', 'connection refused', None))
+    assert not db_.is_online()
+    assert db_.client.pings == 1
+    now[0] += 31
+    assert db_.is_online()
+    assert db_.client.pings == 2
+
+
+def test_templates_map_the_ticker_as_keyword():
+    for layout in Database.LAYOUTS:
+        name = DB(cache_dir='', layout=layout).storage_index('time-series')
+        assert templates[name]['index_patterns'] == [name]
+        assert templates[name]['template']['mappings']['properties']['ticker'] == {'type': 'keyword'}
+
+
+def test_get_ticker_field():
+    db_ = DB(cache_dir='')
+    db_.client = FakeClient(ticker_mappings={'time-series': {'type': 'keyword'},
+                                             'legacy': {'type': 'text', 'fields': {'keyword': {'type': 'keyword'}}}})
+    assert db_.get_ticker_field('time-series') == 'ticker'
+    assert db_.get_ticker_field('legacy') == 'ticker.keyword'
+
+
+def test_search_resolves_the_ticker_field_without_setup():
+    db_ = DB(cache_dir='')
+    db_.client = FakeClient(ticker_mappings={'time-series': {'type': 'text'}})
+    for _ in range(2):
+        query = db_.search('time-series', ['AAPL']).to_dict()['query']
+        assert query == {'terms': {'ticker.keyword': ['AAPL']}}
+    assert db_.client.indices.requests == 1
+    # an index that does not exist yet will be created with its template.
+    assert db_.search('new-index', ['AAPL']).to_dict()['query'] == {'terms': {'ticker': ['AAPL']}}
+
+
+def standard_df(tickers, dates, closes):
+    df = pd.DataFrame({'Close': closes, 'ticker': tickers}, index=pd.Index(dates, name='date'))
+    df.ticker = df.ticker.astype("category")
+    return df
+
+
+def test_bucket_actions_merge_with_stored_buckets(monkeypatch):
+    day = 60 * 60 * 24
+    jan_2021, jan_2022 = 1609459200, 1640995200
+    db_ = DB(cache_dir='', layout='yearly')
+    db_.client = FakeClient(docs={'AAPL|2021': {'ticker': 'AAPL', 'bucket': '2021', 'date': [jan_2021, jan_2021 + day],
+                                                'Close': [1., 2.]}})
+    monkeypatch.setattr(Database, 'MGET_SIZE', 2)
+    df = standard_df(['AAPL', 'AAPL', 'MSFT', 'IBM'], [jan_2021 + day, jan_2022, jan_2021, jan_2021],
+                     [20., 3., 100., np.nan])
+    actions = {action['_id']: action['_source'] for action in db_.bucket_actions('time-series-yearly', df)}
+    # the buckets of all tickers are fetched together, IBM has no Close to store.
+    assert db_.client.mgets == [['AAPL|2021', 'AAPL|2022'], ['MSFT|2021']]
+    assert set(actions) == {'AAPL|2021', 'AAPL|2022', 'MSFT|2021'}
+    # new values win over the stored ones, the other stored days are kept.
+    assert actions['AAPL|2021']['date'] == [jan_2021, jan_2021 + day]
+    assert actions['AAPL|2021']['Close'] == [1., 20.]
+    assert (actions['AAPL|2021']['first_date'], actions['AAPL|2021']['last_date']) == (jan_2021, jan_2021 + day)
+    assert actions['AAPL|2022'] == {'ticker': 'AAPL', 'bucket': '2022', 'first_date': jan_2022,
+                                    'last_date': jan_2022, 'date': [jan_2022], 'Close': [3.]}
+    # with ids only these documents are generated.
+    assert [a['_id'] for a in db_.bucket_actions('time-series-yearly', df, {'MSFT|2021'})] == ['MSFT|2021']
+
+
+def test_split_buckets():
+    hits = [{'ticker': 'AAPL', 'date': [10, 20, 30], 'Close': [1., 2., 3.]},
+            {'ticker': 'MSFT', 'date': [20], 'Close': [5.]}]
+    assert DB(cache_dir='', layout='yearly').split_buckets(hits, after=10) == [
+        {'date': 20, 'Close': 2., 'ticker': 'AAPL'}, {'date': 30, 'Close': 3., 'ticker': 'AAPL'},
+        {'date': 20, 'Close': 5., 'ticker': 'MSFT'}]
+    rows = [{'date': 10, 'Close': 1., 'ticker': 'AAPL'}]
+    assert DB(cache_dir='', layout='daily').split_buckets(rows, after=10) == rows
+
+
+def test_migrate_copies_every_ticker(monkeypatch):
+    source = DB(cache_dir='', layout='daily')
+    histories = {'AAPL': standard_df('AAPL', [10, 20], [1., 2.]), 'MSFT': standard_df('MSFT', [10], [5.])}
+    monkeypatch.setattr(source, 'list_tickers', lambda index_name: list(histories))
+    monkeypatch.setattr(source, 'query_es', lambda index_name, ticker, date: histories[ticker])
+    written = list()
+    monkeypatch.setattr(DB, 'write', lambda self, index_name, df, **kwargs:
+                        written.append((self.layout, index_name, df)) or True)
+    assert source.migrate('time-series', 'monthly') == 2
+    assert [(layout, index_name) for layout, index_name, _ in written] == [('monthly', 'time-series')] * 2
+    assert all([df is histories[ticker] for (_, _, df), ticker in zip(written, histories)])
+
+
+def test_write_retries_rejected_documents(monkeypatch):
+    db_ = DB(cache_dir='', layout='daily')
+    monkeypatch.setattr(db_, 'setup_es_index', lambda index_name: False)
+    sent = list()
+    statuses = iter([[503, 201, 429], [429, 201], [201]])  # per attempt, of each sent document.
+
+    def parallel_bulk(client, actions, **kwargs):
+        actions = list(actions)
+        sent.append([action['_id'] for action in actions])
+        for action, status in zip(actions, next(statuses)):
+            yield status == 201, {'index': {'_id': action['_id'], 'status': status}}
+    monkeypatch.setattr(Database.helpers, 'parallel_bulk', parallel_bulk)
+    backoff = list()
+    monkeypatch.setattr(Database, 'sleep', backoff.append)
+
+    df = standard_df('AAPL', [10, 20, 30, 40], [1., 2., np.nan, 4.])
+    assert db_.write('time-series', df, max_retries=3)
+    ids = ['date10Close1.0tickerAAPL', 'date20Close2.0tickerAAPL', 'date40Close4.0tickerAAPL']
+    # only the rejected documents are sent again, with an exponential backoff.
+    assert sent == [ids, [ids[0], ids[2]], [ids[0]]]
+    assert backoff == [1, 2]
+
+
+def test_write_gives_up_after_max_retries(monkeypatch):
+    db_ = DB(cache_dir='', layout='daily')
+    monkeypatch.setattr(db_, 'setup_es_index', lambda index_name: False)
+    monkeypatch.setattr(Database.helpers, 'parallel_bulk', lambda client, actions, **kwargs: (
+        (False, {'index': {'_id': action['_id'], 'status': 429}}) for action in actions))
+    backoff = list()
+    monkeypatch.setattr(Database, 'sleep', backoff.append)
+    assert not db_.write('time-series', standard_df('AAPL', [10], [1.]), max_retries=2)
+    assert backoff == [1, 2]
+    # documents rejected for other reasons are not retried.
+    monkeypatch.setattr(Database.helpers, 'parallel_bulk', lambda client, actions, **kwargs: (
+        (False, {'index': {'_id': action['_id'], 'status': 400}}) for action in actions))
+    assert not db_.write('time-series', standard_df('AAPL', [10], [1.]), max_retries=2)
+    assert backoff == [1, 2]
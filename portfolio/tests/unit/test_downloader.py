@@ -0,0 +1,171 @@
+import time
+import threading
+import datetime
+import pytest
+import numpy as np
+import pandas as pd
+import yfinance as yf
+from downloader import utils, pipeline
+from downloader.utils import RateLimiter, retry, yf_call_many
+from downloader.manifest import Manifest, DONE, FAILED
+
+
+def test_rate_limiter_burst_and_rate():
+    """
+    Calls within the burst are not throttled, the following ones are spaced by 1/rate seconds.
+    """
+    limiter = RateLimiter(rate=20, burst=3)
+    started_at = time.monotonic()
+    waited = [limiter.acquire() for _ in range(5)]
+    assert waited[:3] == [0, 0, 0]
+    assert all([0 < w <= 0.05 for w in waited[3:]])
+    assert time.monotonic() - started_at >= 0.095
+
+
+def test_retry_until_success():
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) < 3:
+            raise ValueError('flaky')
+        return 'ok'
+    assert retry(flaky, retries=3, backoff=0.01) == 'ok'
+    assert len(calls) == 3
+
+
+def test_retry_raises_last_error():
+    def broken():
+        raise ValueError('broken')
+    with pytest.raises(ValueError):
+        retry(broken, retries=2, backoff=0.01)
+
+
+def fake_download(tickers, start, **kwargs):
+    """Output of yf.download grouped by ticker: a (ticker, field) column index on the union of the dates."""
+    dates = pd.to_datetime(['2022-04-08', '2022-04-11', '2022-04-12']).astype('datetime64[ns]')
+    frames = {t.upper(): pd.DataFrame({'Open': 1., 'Close': [1., 2., 3.]}, index=dates) for t in tickers}
+    frames[tickers[-1].upper()].iloc[0] = np.nan  # listed one day later.
+    if len(tickers) == 1:
+        return frames[tickers[0].upper()]
+    return pd.concat(frames.values(), axis=1, keys=frames.keys())
+
+
+def test_yf_call_many(monkeypatch):
+    monkeypatch.setattr(yf, 'download', fake_download)
+    dfs = yf_call_many(['AAPL', 'bas.f'], datetime.datetime(2022, 4, 8))
+    assert list(dfs) == ['AAPL', 'bas.f']
+    for ticker, df in dfs.items():
+        assert set(df.reset_index().columns) == {'date', 'Close', 'ticker'}
+        assert (df.ticker == ticker).all()
+        # only the days after start, with no empty rows
+        assert df.index.tolist() == [1649635200, 1649721600]
+    dfs = yf_call_many(['AAPL'], datetime.datetime(2022, 4, 11))
+    assert dfs['AAPL'].Close.tolist() == [3.]
+
+
+def test_pipeline_coalesces_writes(monkeypatch):
+    """
+    Rows of many tickers are written together in bulks of at least bulk_rows rows, failed downloads are counted.
+    """
+    def fake_yf_download(tickers, start, limiter=None):
+        if 'FAIL' in tickers:
+            raise ConnectionError('YF is down')
+        return {t: fake_download([t], start) for t in tickers}
+
+    class FakeDB:
+        writes = []
+
+        def write(self, index_name, df):
+            self.writes.append(df)
+            return True
+
+    monkeypatch.setattr(utils, 'yf_download', fake_yf_download)
+    monkeypatch.setattr(utils, 'retry', lambda fun, *args: fun(*args))
+    db = FakeDB()
+    progress = utils.Progress(11)
+    batches = [([f'T{i}', f'T{i + 1}'], None) for i in range(0, 10, 2)] + [(['FAIL'], None)]
+    pipeline.run(db, 'time-series', batches, progress, bulk_rows=4, flush_interval=0.1)
+    assert progress.done == 11 and progress.failed == 1 and progress.rows == 30
+    assert sum([df.shape[0] for df in db.writes]) == 30
+    assert all([df.shape[0] >= 4 for df in db.writes[:-1]])
+    assert len(db.writes) < 10
+
+
+def test_pipeline_retries_empty_downloads(monkeypatch):
+    """
+    yfinance returns empty frames when a call fails, they are retried. A batch still empty after the retries has no
+    new data, it is not a failure.
+    """
+    empty = fake_download(['A'], None).iloc[:0]
+    responses = {'A': [empty, fake_download(['A'], None)], 'B': [empty] * 4}
+    limiters = list()
+
+    def fake_yf_download(tickers, start, limiter=None):
+        limiters.append(limiter)
+        return {t: responses[t].pop(0) for t in tickers}
+    monkeypatch.setattr(utils, 'yf_download', fake_yf_download)
+    monkeypatch.setattr(utils.time, 'sleep', lambda seconds: None)
+    done = dict()
+    limiter = utils.RateLimiter(rate=100)
+    class FakeDB:
+        def write(self, index_name, df):
+            return True
+
+    pipeline.run(FakeDB(), 'time-series', [(['A'], None), (['B'], None)], utils.Progress(2), bulk_rows=1,
+                 flush_interval=0.1, on_done=lambda ticker, rows, error: done.update({ticker: (rows, error)}),
+                 limiter=limiter)
+    assert done == {'A': (3, None), 'B': (0, None)}
+    assert len(limiters) == 6 and all([lim is limiter for lim in limiters])
+
+
+def test_pipeline_survives_failing_on_done(monkeypatch):
+    """
+    An error while reporting the outcome of a ticker, e.g. when the manifest cannot be saved, does not stop the indexer.
+    """
+    def on_done(ticker, rows, error):
+        raise OSError('No space left on device')
+
+    class FakeDB:
+        def write(self, index_name, df):
+            return True
+
+    monkeypatch.setattr(utils, 'yf_download', lambda tickers, start, limiter=None:
+                        {t: fake_download([t], start) for t in tickers})
+    progress = utils.Progress(40)
+    batches = [([f'T{i}'], None) for i in range(40)]  # more items than the queues hold.
+    runner = threading.Thread(target=pipeline.run, args=(FakeDB(), 'time-series', batches, progress),
+                              kwargs=dict(bulk_rows=1, flush_interval=0.1, queue_size=2, on_done=on_done), daemon=True)
+    runner.start()
+    runner.join(timeout=10)
+    assert not runner.is_alive()
+    assert progress.done == 40
+
+
+def test_manifest_resume_and_backoff(tmp_path):
+    """
+    A resumed cycle skips the done tickers, failed tickers are skipped until their backoff is over, also in new cycles.
+    """
+    path = str(tmp_path / 'db-update.json')
+    manifest = Manifest(path, backoff=60)
+    assert manifest.start(['A', 'B', 'C']) == ['A', 'B', 'C']
+    manifest.record('A', 10)
+    manifest.record('B', error='YF call failed')
+    manifest.save(force=True)  # interrupted before C.
+
+    manifest = Manifest(path, backoff=60)
+    assert manifest.unfinished and manifest.cycle == ['A', 'B', 'C']
+    assert manifest.start(manifest.cycle, resume=True) == ['C']
+    manifest.record('C', 5)
+    manifest.finish()
+
+    manifest = Manifest(path, backoff=60)
+    assert not manifest.unfinished
+    assert manifest.start(['A', 'B', 'C'], resume=True) == ['A', 'C']
+    assert manifest.tickers['B']['status'] == FAILED and manifest.tickers['B']['attempts'] == 1
+    manifest.tickers['B']['next_attempt'] = 0  # backoff is over.
+    assert manifest.start(['A', 'B', 'C']) == ['A', 'B', 'C']
+    manifest.record('B', error='YF call failed')
+    assert manifest.tickers['B']['next_attempt'] - manifest.tickers['B']['last_attempt'] == 120
+    manifest.record('B', 1)
+    assert manifest.tickers['B']['status'] == DONE and manifest.tickers['B']['attempts'] == 0
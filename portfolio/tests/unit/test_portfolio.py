@@ -6,6 +6,7 @@ from portfolio.Position import Position
 from portfolio.Ticker import Ticker
 from portfolio import Database
 import numpy as np
+import pandas as pd
 
 SECONDS_IN_A_DAY = (60 * 60 * 24)
 # some example dates.
@@ -95,3 +96,43 @@ def test_benchmark_returns_must_be_same_when_tested_against_():
 #     p = Portfolio(pp.tickers, benchmark_symbol='FB')
 #     a = 1 + 3
 #     p.summary
+
+
+def test_incremental_updates():
+    pos1 = Position(action='buy', quantity=1, ticker='FB', date=a_monday, cost=100)
+    pos2 = Position(action='buy', quantity=2, ticker='GOOG', date=a_monday, cost=50)
+    p = Portfolio([Ticker([pos1], value=100, today=a_monday), Ticker([pos2], value=50, today=a_monday)])
+    p.append_prices(pd.DataFrame({'FB': [110, 120], 'GOOG': [60, 70]}, index=[a_tuesday, a_wednesday]))
+    p.add_position(Position(action='sell', quantity=1, ticker='FB', date=a_wednesday))
+    p.add_position(Position(action='buy', quantity=1, ticker='FB', date=a_wednesday, cost=120))
+
+    assert p.portfolio_returns.index.tolist() == [a_monday, a_tuesday, a_wednesday]
+    assert p.current_profit_loss_per_ticker == {'FB': 20, 'GOOG': 0}
+    assert p.current_value_per_ticker == {'FB': 120, 'GOOG': 140}
+    assert len(p.benchmark_positions) == 4
+
+
+def test_panel_on_a_global_day_axis():
+    pos1 = Position(action='buy', quantity=1, ticker='FB', date=a_wednesday, cost=100)
+    pos2 = Position(action='buy', quantity=2, ticker='GOOG', date=a_monday, cost=50)
+    p = Portfolio([Ticker([pos1], value=[100, 120], today=a_thursday),
+                   Ticker([pos2], value=[50, 50, 75, 75], today=a_thursday)])
+
+    panel = p.panel
+    assert panel['days'].tolist() == [a_monday, a_tuesday, a_wednesday, a_thursday]
+    assert panel['mask'].tolist() == [[False, False, True, True], [True, True, True, True]]
+    assert np.allclose(p.portfolio_returns.values, [0, 0, 50 * 100 / 200, (20 * 100 + 50 * 100) / 200])
+    assert p.current_gross_value_global == 120 + 150
+
+
+def test_panel_follows_changes_of_the_tickers():
+    pos1 = Position(action='buy', quantity=1, ticker='FB', date=a_monday, cost=100)
+    t = Ticker([pos1], value=100, today=a_monday)
+    p = Portfolio([t])
+    assert p.portfolio_returns.tolist() == [0]
+
+    t.append_prices([a_tuesday], [150])  # the ticker changes without the portfolio.
+    assert p.portfolio_returns.index.tolist() == [a_monday, a_tuesday]
+    assert p.portfolio_returns.tolist() == [0, 50]
+    t.add_position(Position(action='buy', quantity=1, ticker='FB', date=a_tuesday, cost=50))
+    assert p.portfolio_returns.tolist() == [0, 100]
@@ -1,4 +1,6 @@
 import pytest
+import pandas as pd
+from portfolio import Position as position
 from portfolio.Position import Position
 from portfolio.utils import last_monday
 import numpy as np
@@ -45,3 +47,21 @@ def test_a_holiday():
     date = 1579478400  # Martin Luther King, Jr.
     pos = Position(action='buy', quantity=1, ticker=ticker, date=date)
     assert pos.cost is not np.nan
+
+
+def test_values_at_in_a_single_read(monkeypatch):
+    day = 24 * 60 * 60
+    a_monday = 1649635200
+    reads = []
+
+    def read_many(tickers, date, fill_na=True):
+        reads.append((tickers, date))
+        # FB has no value on Monday and Tuesday, GOOG is not stored.
+        return pd.DataFrame({'FB': [np.nan, np.nan, 3., 4., 5., 6.], 'GOOG': np.nan},
+                            index=pd.Index([a_monday + n * day for n in range(6)], name='date'))
+
+    monkeypatch.setattr(position.db, 'read_many', read_many)
+    costs = Position.values_at(['FB', 'FB', 'GOOG', 'FB'], [a_monday, a_monday + 2 * day, a_monday, a_monday - 2 * day])
+    assert len(reads) == 1 and reads[0][0] == ['FB', 'GOOG']
+    # the value of the nearest following day within 3 days is taken.
+    assert np.array_equal(costs, [3, 3, np.nan, np.nan], equal_nan=True)
@@ -0,0 +1,90 @@
+import time
+import datetime
+import numpy as np
+import pandas as pd
+import pytest
+import downloader.__main__ as downloader
+from downloader import utils
+from downloader.sources import MarketDataSource, RecordingSource, ReplaySource
+from portfolio.SQLiteDatabase import SQLiteDB
+
+start = datetime.datetime(2022, 4, 11)
+
+
+class FakeSource(MarketDataSource):
+    """Ten days of prices for any ticker, starting on 2022-04-11."""
+
+    def history(self, ticker, start_):
+        index = pd.date_range('2022-04-11', periods=10, freq='D', name='Date').astype('datetime64[ns]')
+        df = pd.DataFrame({'Open': 1., 'Close': np.arange(10.) + len(ticker), 'Volume': 100}, index=index)
+        return df.loc[df.index >= pd.Timestamp(start_.date())]
+
+    def listed_tickers(self):
+        return pd.DataFrame({'Symbol': ['A', 'BB']})
+
+
+def test_sources_implement_the_interface():
+    with pytest.raises(TypeError):
+        MarketDataSource()
+
+    class HistoryOnly(MarketDataSource):
+        def history(self, ticker, start_):
+            return pd.DataFrame()
+    with pytest.raises(TypeError):
+        HistoryOnly()
+    assert FakeSource().download(['A'], start)['A'].shape[0] == 10
+
+
+def test_record_and_replay(tmp_path):
+    recording = RecordingSource(FakeSource(), str(tmp_path))
+    recorded = recording.download(['A', 'BB'], datetime.datetime(2022, 4, 15))
+    recording.history('A', start)  # merged with the rows recorded before.
+    recording.listed_tickers()
+
+    replay = ReplaySource(str(tmp_path))
+    assert replay.listed_tickers()['Symbol'].tolist() == ['A', 'BB']
+    assert replay.history('A', start).shape[0] == 10
+    pd.testing.assert_frame_equal(replay.download(['BB'], datetime.datetime(2022, 4, 15))['BB'], recorded['BB'],
+                                  check_freq=False, check_names=False)
+    assert replay.history('UNKNOWN', start).empty
+
+
+def test_replay_latency_and_errors(tmp_path):
+    RecordingSource(FakeSource(), str(tmp_path)).history('A', start)
+    replay = ReplaySource(str(tmp_path), latency=0.05, jitter=0.01)
+    started_at = time.monotonic()
+    replay.history('A', start)
+    assert 0.05 <= time.monotonic() - started_at < 0.5
+    with pytest.raises(ConnectionError):
+        ReplaySource(str(tmp_path), error_rate=1.).download(['A'], start)
+
+    def failures(seed):
+        replay_ = ReplaySource(str(tmp_path), error_rate=0.3, seed=seed)
+        return [fails(replay_) for _ in range(50)]
+    assert failures(1) == failures(1) and 0 < sum(failures(1)) < 50
+
+
+def fails(source):
+    try:
+        source.call('A')
+    except ConnectionError:
+        return True
+    return False
+
+
+def test_updater_replays_to_sqlite(tmp_path, monkeypatch):
+    """
+    End to end update of a local DB from a replayed recording, tickers hit by injected errors are not written.
+    """
+    recording = str(tmp_path / 'market-data')
+    RecordingSource(FakeSource(), recording).download(['A', 'BB', 'CCC', 'DDDD'], start)
+    db = SQLiteDB(str(tmp_path / 'benchmark.sqlite'), cache_dir='')
+    monkeypatch.setattr(downloader, 'get_db', lambda: db)
+    replay = ReplaySource(recording, error_rate=0.5, seed=3)
+    monkeypatch.setattr(utils, 'get_source', lambda: replay)
+    monkeypatch.setattr(utils, 'retry', lambda fun, *args: fun(*args))
+    downloader.updater(['A', 'BB', 'CCC', 'DDDD'], batch_size=1, concurrency=2)
+    last_dates = db.last_dates()
+    assert 0 < len(last_dates) < 4
+    for ticker in last_dates:
+        assert db.read(ticker, output_format='series').tolist() == list(np.arange(10.) + len(ticker))
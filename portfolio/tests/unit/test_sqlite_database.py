@@ -0,0 +1,139 @@
+import pandas as pd
+import numpy as np
+import pytest
+from portfolio.SQLiteDatabase import SQLiteDB
+from portfolio.Database import get_db, DB
+from portfolio import Database
+
+day = 60 * 60 * 24
+dates = np.arange(1649635200, 1649635200 + 10 * day, day, dtype=int)
+
+
+def standard_df(ticker, dates_, values):
+    df = pd.DataFrame({'Close': values, 'ticker': ticker}, index=pd.Index(dates_, name='date'))
+    df.ticker = df.ticker.astype("category")
+    return df
+
+
+@pytest.fixture
+def db(tmp_path):
+    db_ = SQLiteDB(str(tmp_path / 'benchmark.sqlite'), cache_dir='')
+    assert db_.write('time-series', standard_df('AAPL', dates, np.arange(10.)))
+    assert db_.write('time-series', standard_df('MSFT', dates[:5], np.arange(5.) + 100))
+    return db_
+
+
+def test_read_requested_dates(db):
+    s = db.read('AAPL', list(dates[2:4]), output_format='series')
+    assert s.index.tolist() == list(dates[2:4])
+    assert s.tolist() == [2., 3.]
+
+
+def test_read_full_history(db):
+    df = db.read('MSFT')
+    assert df.index.tolist() == list(dates[:5])
+    assert set(df.reset_index().columns) == {'date', 'Close', 'ticker'}
+
+
+def test_write_twice_does_not_duplicate(db):
+    assert db.write('time-series', standard_df('AAPL', dates[8:], [80., 90.]))
+    s = db.read('AAPL', output_format='series')
+    assert s.shape[0] == 10
+    assert s.iloc[-2:].tolist() == [80., 90.]
+
+
+def test_read_many(db):
+    panel = db.read_many(['AAPL', 'MSFT'], list(dates), fill_na=False)
+    assert panel.shape == (10, 2)
+    assert panel['MSFT'].isna().sum() == 5
+    assert panel['AAPL'].tolist() == list(np.arange(10.))
+
+
+def test_read_after(db):
+    df = db.query_es('time-series', 'AAPL', None, after=int(dates[7]))
+    assert df.index.tolist() == list(dates[8:])
+
+
+def test_delete_and_list_tickers(db):
+    assert db.list_tickers() == ['AAPL', 'MSFT']
+    db.delete_ticker('MSFT')
+    assert db.list_tickers() == ['AAPL']
+    assert db.query_es('time-series', 'MSFT', None).empty
+
+
+def test_backend_selection(monkeypatch, tmp_path):
+    monkeypatch.setenv('BENCHMARK_SQLITE_PATH', str(tmp_path / 'env.sqlite'))
+    assert type(get_db.__wrapped__(backend='sqlite')) is SQLiteDB
+    with pytest.raises(ValueError):
+        get_db.__wrapped__(backend='mongo')
+
+
+def test_last_dates(db):
+    assert db.last_dates() == {'AAPL': dates[-1], 'MSFT': dates[4]}
+    assert db.last_dates(tickers=['MSFT', 'GOOG']) == {'MSFT': dates[4]}
+
+
+def test_is_not_an_es_backend(db):
+    assert not isinstance(db, DB)
+    assert not hasattr(db, 'client') and not hasattr(db, 'migrate')
+    with pytest.raises(TypeError):
+        from portfolio.AsyncDatabase import AsyncDB
+        AsyncDB(db)
+
+
+def test_memory_cache_is_opt_in(db, monkeypatch):
+    # without cache tiers only the requested dates are read, not the full history.
+    assert db.memory_cache is None
+    requested = list()
+    scan_rows = db.scan_rows
+    monkeypatch.setattr(db, 'scan_rows', lambda index_name, tickers, date=None, after=None:
+                        requested.append(date) or scan_rows(index_name, tickers, date, after))
+    db.read('AAPL', list(dates[2:4]))
+    assert requested == [list(dates[2:4])]
+    monkeypatch.setenv('BENCHMARK_MEMORY_CACHE_SIZE', '8')
+    assert SQLiteDB(db.path, cache_dir='').memory_cache is not None
+
+
+def test_write_updates_the_memory_cache(tmp_path):
+    db_ = SQLiteDB(str(tmp_path / 'cached.sqlite'), cache_dir='', memory_cache_size=8)
+    assert db_.write('time-series', standard_df('AAPL', dates[:5], np.arange(5.)))
+    assert db_.read('AAPL', output_format='series').tolist() == [0., 1., 2., 3., 4.]
+    assert db_.write('time-series', standard_df('AAPL', dates[4:7], [40., 50., 60.]))
+    # the cached history was updated in place of being dropped.
+    assert ('time-series', 'AAPL') in db_.memory_cache
+    assert db_.read('AAPL', output_format='series').tolist() == [0., 1., 2., 3., 40., 50., 60.]
+    assert db_.read('AAPL', output_format='series').equals(db_.query_es('time-series', 'AAPL', None)['Close']
+                                                           .rename('AAPL'))
+
+
+def test_flush_reports_failed_background_writes(db, monkeypatch):
+    monkeypatch.setattr(db, 'write', lambda *args, **kwargs: False)
+    db.write_async('time-series', standard_df('AAPL', dates[:2], [1., 2.])).result()
+    # the failed write is no longer pending, it is still reported once.
+    assert not db.flush()
+    assert db.flush()
+
+
+def test_read_many_fetches_uncached_tickers_at_once(db, tmp_path, monkeypatch):
+    db_ = SQLiteDB(db.path, cache_dir=str(tmp_path / 'cache'))
+    db_.read('AAPL')  # AAPL is cached on disk, MSFT and IBM are not.
+    assert db_.write('time-series', standard_df('IBM', dates[:3], [7., 8., 9.]))
+    scanned = list()
+    scan_rows = db_.scan_rows
+    monkeypatch.setattr(db_, 'scan_rows', lambda index_name, tickers, date=None, after=None:
+                        scanned.append(list(tickers)) or scan_rows(index_name, tickers, date, after))
+    panel = db_.read_many(['MSFT', 'AAPL', 'IBM'], list(dates[3:6]), fill_na=False)
+    assert sorted(scanned) == [['AAPL'], ['MSFT', 'IBM']]
+    assert panel.columns.tolist() == ['MSFT', 'AAPL', 'IBM']
+    assert panel['AAPL'].tolist() == [3., 4., 5.]
+    assert panel['MSFT'].iloc[:2].tolist() == [103., 104.] and np.isnan(panel['MSFT'].iloc[2])
+    assert panel['IBM'].isna().all()
+    assert db_.disk_cache.has('time-series', 'MSFT') and db_.disk_cache.has('time-series', 'IBM')
+
+
+def test_read_many_unknown_ticker_full_history(db, monkeypatch):
+    monkeypatch.setattr(Database.utils, 'yf_call', lambda ticker: pd.DataFrame())
+    panel = db.read_many(['AAPL', 'ZZZ'], fill_na=False)
+    assert panel.columns.tolist() == ['AAPL', 'ZZZ']
+    assert panel['AAPL'].tolist() == list(np.arange(10.))
+    assert panel['ZZZ'].isna().all()
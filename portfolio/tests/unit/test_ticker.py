@@ -312,3 +312,88 @@ def test_fractional_shares():
                                                                [0, 2.5],
                                                                [0, 2.5],
                                                                ]), equal_nan=True)
+
+
+def test_sell_across_lots():
+    # a sell larger than the first lot closes it and continues with the next ones, the last lot stays untouched.
+    pos1 = Position(action='buy', quantity=1, ticker='FB', date=a_monday, cost=100)
+    pos2 = Position(action='buy', quantity=2, ticker='FB', date=a_monday, cost=110)
+    pos3 = Position(action='buy', quantity=4, ticker='FB', date=a_tuesday, cost=120)
+    pos4 = Position(action='sell', quantity=5, ticker='FB', date=a_wednesday)
+    pos5 = Position(action='buy', quantity=1, ticker='FB', date=a_thursday, cost=130)
+    t = Ticker([pos1, pos2, pos3, pos4, pos5], value=[100, 120, 130, 130], today=a_thursday)
+
+    assert np.array_equal(t.mat_quantity.values, np.vstack([[1, 2, np.nan, np.nan],
+                                                            [1, 2, 4, np.nan],
+                                                            [0, 0, 2, np.nan],
+                                                            [0, 0, 2, 1],
+                                                            ]), equal_nan=True)
+    assert np.array_equal(t.mat_profit_loss.values[2], [30, 40, 20, np.nan], equal_nan=True)
+    assert t.current_open_shares == 3
+    assert t.current_invested == 2 * 120 + 130
+    assert t.current_value == 3 * 130
+
+
+def test_sell_heavy_history():
+    # each sell skips the lots closed before, which must not depend on the recursion limit.
+    n = 1100
+    buys = [Position(action='buy', quantity=1, ticker='FB', date=a_monday, cost=100) for _ in range(n)]
+    sells = [Position(action='sell', quantity=1, ticker='FB', date=a_tuesday) for _ in range(n)]
+    t = Ticker(buys + sells, value=[100, 110], today=a_tuesday)
+
+    assert t.current_open_shares == 0
+    assert t.current_closed_shares == n
+    closings = t.closings
+    assert closings.lot.tolist() == list(range(n))
+    assert (closings.date == a_tuesday).all() and (closings.quantity == 1).all() and (closings.left == 0).all()
+
+
+def test_profit_loss_follows_the_ticker_value():
+    # the sold shares are valued at the current value of the ticker, all sells count from the start of the time line.
+    pos1 = Position(action='buy', quantity=2, ticker='FB', date=a_monday, cost=100)
+    pos2 = Position(action='sell', quantity=1, ticker='FB', date=a_tuesday)
+    pos3 = Position(action='sell', quantity=1, ticker='FB', date=a_thursday)
+    t = Ticker([pos1, pos2, pos3], value=[100, 120, 90, 150], today=a_thursday)
+
+    assert t.tc_profit_loss.tolist() == [0, 20, -10, 100]
+    assert t.tc_open_shares.tolist() == [0, 0, 0, 0]
+    assert t.tc_invested.tolist() == [200, 100, 100, 0]
+    assert np.array_equal(t.tc_value.values, [200, 120, 90, np.nan], equal_nan=True)
+    assert np.array_equal(t.mat_profit_loss.values[:, 0], [0, 20, -10, 100])
+    assert t.lot_table.close_date.tolist() == [a_thursday]
+
+
+def test_time_line_and_time_courses_are_cached():
+    next_monday = a_friday + 3 * 24 * 60 * 60
+    assert Ticker.make_time_line(a_wednesday, next_monday).tolist() == [a_wednesday, a_thursday, a_friday,
+                                                                         next_monday]
+    pos1 = Position(action='buy', quantity=2, ticker='FB', date=a_monday, cost=100)
+    t = Ticker([pos1], value=[100, 110], today=a_tuesday)
+    assert t.time_line is t.time_line
+    assert t.tc_returns is t.tc_returns and t.tc_cost.name == 'tc_cost' and t.tc_invested.name == 'tc_invested'
+    returns = t.tc_returns
+    t.positions.append(Position(action='sell', quantity=1, ticker='FB', date=a_tuesday))
+    t.update()
+    assert t.tc_returns is not returns and t.current_open_shares == 1
+
+
+def test_incremental_updates_match_a_rebuild():
+    pos1 = Position(action='buy', quantity=2, ticker='FB', date=a_monday, cost=100)
+    pos2 = Position(action='buy', quantity=3, ticker='FB', date=a_tuesday, cost=110)
+    pos3 = Position(action='sell', quantity=4, ticker='FB', date=a_thursday)
+    pos4 = Position(action='buy', quantity=1, ticker='FB', date=a_wednesday, cost=120)
+    value = [100, 120, np.nan, 130, 140]
+    t = Ticker([pos1], value=value[:2], today=a_tuesday)
+    t.append_prices([a_wednesday, a_thursday, a_friday], value[2:])
+    for pos in [pos2, pos3, pos4]:  # the last one is replayed with all positions.
+        t.add_position(pos)
+    rebuilt = Ticker([pos1, pos2, pos3, pos4], value=value, today=a_friday)
+
+    assert t.time_line.tolist() == rebuilt.time_line.tolist()
+    for name in ['tc_ticker_value', 'tc_invested', 'tc_value', 'tc_profit_loss', 'tc_open_shares', 'mat_quantity']:
+        assert np.array_equal(getattr(t, name).values, getattr(rebuilt, name).values, equal_nan=True)
+    with pytest.raises(ValueError):
+        t.append_prices([a_friday], [150])
+    with pytest.raises(ValueError):
+        t.add_position(Position(action='sell', quantity=10, ticker='FB', date=a_friday))
+    assert len(t.positions) == 4
@@ -0,0 +1,86 @@
+import datetime
+import pandas as pd
+from downloader.trading_calendar import CALENDARS, calendar_of, easter, nyse_holidays, xetra_holidays, session_time
+from downloader.scheduler import Scheduler
+
+nyse = CALENDARS['NYSE']
+
+
+def at(text, tz='America/New_York'):
+    return pd.Timestamp(text, tz=tz).timestamp()
+
+
+def test_holidays():
+    assert [easter(y) for y in (2019, 2022, 2024)] == [datetime.date(2019, 4, 21), datetime.date(2022, 4, 17),
+                                                       datetime.date(2024, 3, 31)]
+    assert sorted(nyse_holidays(2022)) == [datetime.date(2022, 1, 17), datetime.date(2022, 2, 21),
+                                           datetime.date(2022, 4, 15), datetime.date(2022, 5, 30),
+                                           datetime.date(2022, 6, 20), datetime.date(2022, 7, 4),
+                                           datetime.date(2022, 9, 5), datetime.date(2022, 11, 24),
+                                           datetime.date(2022, 12, 26)]
+    assert datetime.date(2023, 1, 2) in nyse_holidays(2023)
+    assert datetime.date(2022, 4, 18) in xetra_holidays(2022)  # Easter Monday
+    assert calendar_of('BAS.F').name == 'FRA' and calendar_of('SAP.DE').name == 'XETRA'
+    assert calendar_of('AAPL') is nyse
+
+
+def test_last_session_skips_holidays_and_open_sessions():
+    good_friday = at('2022-04-15 18:00')
+    assert nyse.last_session(good_friday) == datetime.date(2022, 4, 14)
+    assert nyse.last_session(at('2022-04-14 15:59')) == datetime.date(2022, 4, 13)
+    assert nyse.last_session(at('2022-04-14 16:10'), delay=30 * 60) == datetime.date(2022, 4, 13)
+    assert session_time(datetime.date(2022, 4, 14)) == 1649894400
+
+
+def test_next_refresh():
+    assert nyse.next_refresh(at('2022-04-14 16:10'), delay=30 * 60) == at('2022-04-14 16:30')
+    assert nyse.next_refresh(at('2022-04-14 16:30'), delay=30 * 60) == at('2022-04-18 16:30')
+    assert CALENDARS['FRA'].next_refresh(at('2022-12-23 23:00', 'Europe/Berlin')) == at('2022-12-27 22:00',
+                                                                                         'Europe/Berlin')
+
+
+def test_scheduler_updates_the_tickers_of_the_due_exchanges(monkeypatch):
+    updates = []
+    scheduler = Scheduler(updates.append, delay=30 * 60)
+    monkeypatch.setattr(scheduler, 'tickers', lambda: {'NYSE': ['AAPL', 'MSFT'], 'FRA': ['BAS.F']})
+    assert scheduler.next_run(at('2022-04-13 11:00')) == (at('2022-04-13 12:00'), ['XETRA'])
+    scheduler.run_once(['XETRA'])
+    assert updates == []
+    # floor trading in Frankfurt closes at the same time as the NYSE.
+    when, exchanges = scheduler.next_run(at('2022-04-14 12:00'))
+    assert (when, exchanges) == (at('2022-04-14 16:30'), ['NYSE', 'FRA'])
+    scheduler.run_once(exchanges)
+    assert updates == [['AAPL', 'MSFT'], ['BAS.F']]
+
+
+def test_scheduler_catches_up_sessions_that_closed_during_an_update(monkeypatch):
+    clock = [at('2022-04-14 11:00')]
+    updates = []
+
+    def update(tickers):
+        updates.append((tickers, clock[0]))
+        clock[0] += 6 * 60 * 60  # a long update, the NYSE and FRA sessions close meanwhile.
+        if len(updates) == 3:
+            scheduler.stop()
+
+    scheduler = Scheduler(update, delay=30 * 60)
+    monkeypatch.setattr(scheduler, 'tickers', lambda: {'NYSE': ['AAPL'], 'XETRA': ['SAP.DE'], 'FRA': ['BAS.F']})
+    monkeypatch.setattr(scheduler, 'sessions', lambda now=None: Scheduler.sessions(scheduler, clock[0]))
+    monkeypatch.setattr(scheduler, 'next_run', lambda now=None: Scheduler.next_run(scheduler, clock[0]))
+    monkeypatch.setattr(scheduler.stopped, 'wait', lambda seconds: clock.__setitem__(0, clock[0] + seconds))
+    monkeypatch.setattr('downloader.scheduler.time', lambda: clock[0])
+    scheduler.run(catch_up=False)
+    # XETRA is updated when due, NYSE and FRA right after it without waiting for their next sessions.
+    assert updates == [(['SAP.DE'], at('2022-04-14 12:00')), (['AAPL'], at('2022-04-14 18:00')),
+                       (['BAS.F'], at('2022-04-15 00:00'))]
+    assert scheduler.last_updated == {name: datetime.date(2022, 4, 14) for name in ('NYSE', 'XETRA', 'FRA')}
+    assert scheduler.due(at('2022-04-18 12:00')) == []
+
+
+def test_scheduler_catch_up_runs_every_exchange_at_start(monkeypatch):
+    scheduler = Scheduler(lambda tickers: None, delay=30 * 60)
+    assert scheduler.due(at('2022-04-14 11:00')) == ['NYSE', 'XETRA', 'FRA']
+    monkeypatch.setattr(scheduler, 'tickers', lambda: {})
+    scheduler.run_once(['NYSE'], now=at('2022-04-14 11:00'))
+    assert scheduler.due(at('2022-04-14 11:00')) == ['XETRA', 'FRA']
+    assert scheduler.due(at('2022-04-14 16:30')) == ['NYSE', 'XETRA', 'FRA']
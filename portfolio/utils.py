@@ -3,7 +3,6 @@ from math import floor
 import logging
 import os
 import datetime
-import yfinance as yf
 from typing import AnyStr
 from functools import lru_cache
 
@@ -92,8 +91,8 @@ def is_valid_ticker(ticker: AnyStr) -> bool:
         ticker:
     Returns:
     """
-    start = parse_epoch(last_monday()).strftime('%Y-%m-%d')
-    df = yf.Ticker(ticker).history(start=start, interval='1d')
+    from downloader.sources import get_source  # imports this module.
+    df = get_source().history(ticker, parse_epoch(last_monday()))
     if not df.empty:
         return True
     else: